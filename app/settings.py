@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from django.contrib.messages import constants as messages
 from pathlib import Path
+from urllib.parse import urlsplit
 from environ import Env
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +56,7 @@ LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = '/login/'
 
 MIDDLEWARE = [
+    'meal_together.instrumentation.request_metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,9 +68,32 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'app.urls'
 
+# Request metrics, see meal_together/instrumentation.py. Every request gets a
+# Server-Timing header and a JSON log line; a sample of them (and every one
+# over its thresholds) is kept for the staff-only request metrics page.
+REQUEST_METRICS_SAMPLE_RATE = env.float('REQUEST_METRICS_SAMPLE_RATE', default=0.1)
+REQUEST_METRICS_BUFFER_SIZE = env.int('REQUEST_METRICS_BUFFER_SIZE', default=500)
+# Warning thresholds per URL name, over 'default'. Keys: queries, db_ms,
+# template_ms, total_ms.
+REQUEST_METRICS_THRESHOLDS = {
+    'default': {'queries': 30, 'db_ms': 300, 'total_ms': 1000},
+    'session_list': {'queries': 10},
+    'session_detail': {'queries': 10},
+    'session_summary': {'queries': 10},
+    'credit_balance': {'queries': 10},
+    # Savepoints, ledger and counter updates and the outbox row add up
+    'create_order': {'queries': 40},
+    'edit_order': {'queries': 50},
+    # Menu imports write thousands of rows in batches
+    'import_menu': {'queries': 200, 'db_ms': 3000, 'total_ms': 10000},
+    # Event streams are recorded when closed, after the client stopped listening
+    'session_events': {'total_ms': float('inf')},
+}
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render times reported to the request metrics
+        'BACKEND': 'meal_together.instrumentation.TimedDjangoTemplates',
         'DIRS': [
             BASE_DIR / 'templates'
         ],
@@ -100,6 +126,56 @@ DATABASES = {
     }
 }
 
+# Connection reuse. By default every process keeps a psycopg connection pool
+# of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections. Without the pool,
+# DB_CONN_MAX_AGE keeps one connection per thread open for that many
+# seconds, which only suits the sync processes: under ASGI every request
+# runs on a new thread.
+#
+# All processes together stay within DB_MAX_CONNECTIONS, below PostgreSQL's
+# default max_connections of 100. A request holds one connection at a time,
+# so a web worker needs at most one per ASGI thread. The email worker's
+# prefork children and the sweeper run one task at a time and get a single
+# connection each from supervisord.conf; the web workers share the rest.
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', default=os.cpu_count() * 2 + 1)
+ASGI_THREADS = env.int('ASGI_THREADS', default=os.cpu_count() * 4)
+CELERY_WORKER_CONCURRENCY = env.int('CELERY_WORKER_CONCURRENCY', default=os.cpu_count())
+DB_MAX_CONNECTIONS = env.int('DB_MAX_CONNECTIONS', default=90)
+DB_POOL_MAX_SIZE = env.int(
+    'DB_POOL_MAX_SIZE',
+    default=max(
+        1,
+        min(
+            ASGI_THREADS,
+            (DB_MAX_CONNECTIONS - CELERY_WORKER_CONCURRENCY - 1) // WEB_CONCURRENCY,
+        ),
+    ),
+)
+if env.bool('DB_POOL', default=True):
+    # Django has the pool test every connection on checkout
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=min(2, DB_POOL_MAX_SIZE)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': env.int('DB_POOL_TIMEOUT', default=10),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Shared by all processes, so invalidating a cached menu, directory page or
+# search reaches every web worker. Database 1 of the broker's Redis by
+# default; CACHE_URL=locmemcache:// only suits a single process.
+
+CACHES = {
+    'default': env.cache(
+        'CACHE_URL', default=urlsplit(env('REDIS_URL'))._replace(path='/1').geturl()
+    ),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -138,6 +214,13 @@ EMAIL_HOST_USER=env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD=env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL=env('DEFAULT_FROM_EMAIL')
 
+# Outgoing mail is coalesced for EMAIL_BATCH_WINDOW seconds and sent in
+# batches over a pooled connection (0 sends each message straight away)
+EMAIL_BATCH_WINDOW = env.int('EMAIL_BATCH_WINDOW', default=2)
+EMAIL_BATCH_SIZE = env.int('EMAIL_BATCH_SIZE', default=100)
+EMAIL_MAX_RETRIES = env.int('EMAIL_MAX_RETRIES', default=5)
+EMAIL_RETRY_BACKOFF = env.int('EMAIL_RETRY_BACKOFF', default=30)
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
@@ -165,4 +248,36 @@ MESSAGE_TAGS = {
 }
 
 CELERY_BROKER_URL = env('REDIS_URL')
-CELERY_RESULT_BACKEND = env('REDIS_URL')
\ No newline at end of file
+CELERY_RESULT_BACKEND = env('REDIS_URL')
+
+# Every Celery task sends mail, on its own queue so the worker can be sized
+# and scaled separately. The pooled SMTP connection is per process, hence a
+# prefork pool, one process per CPU by default.
+CELERY_TASK_ROUTES = {
+    'meal_together.tasks.send_email_task': {'queue': 'email'},
+    'meal_together.tasks.send_email_batch_task': {'queue': 'email'},
+    'meal_together.tasks.flush_email_queue': {'queue': 'email'},
+    'meal_together.tasks.dispatch_email_event_task': {'queue': 'email'},
+}
+# CELERY_WORKER_CONCURRENCY is set with the database connection budget above
+# Batches can take a while, do not let one process hoard queued tasks
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Live session updates are published over Redis pub/sub. 'memory' keeps them
+# inside one process, for tests and the development server.
+SESSION_EVENTS_BACKEND = env('SESSION_EVENTS_BACKEND', default='redis')
+
+# Application logs, including the JSON request metrics, go to stdout
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'meal_together': {
+            'handlers': ['console'],
+            'level': env('LOG_LEVEL', default='INFO'),
+        },
+    },
+}
@@ -15,9 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('meal_together.urls'))
 ]
+
+# runserver served static files by itself, the ASGI server does not. Only
+# active with DEBUG on.
+urlpatterns += staticfiles_urlpatterns()
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the web process, see supervisord.conf.
+
+Gunicorn supervises WEB_CONCURRENCY uvicorn worker processes running
+app/asgi.py. Sync code in each worker (templates, ORM queries of the async
+views) runs on a pool of ASGI_THREADS threads.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Read by asgiref when it creates the thread pool of each worker
+os.environ.setdefault('ASGI_THREADS', str(multiprocessing.cpu_count() * 4))
+
+# Live session streams stay open, so only a silent worker counts as stuck
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Recycle workers now and then to contain slow leaks, staggered so they do
+# not all restart at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
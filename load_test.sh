@@ -0,0 +1,35 @@
+#!/bin/bash
+# Show how throughput scales with cores: start gunicorn with 1, 2, 4, ...
+# workers up to the CPU count and run manage.py load_test against each.
+#
+#   ./load_test.sh <username> [load_test options, e.g. --path /sessions/]
+
+set -e
+
+USERNAME=${1:?usage: $0 <username> [load_test options]}
+shift
+PORT=${LOAD_TEST_PORT:-8099}
+CORES=$(nproc)
+
+worker_counts=""
+for ((workers = 1; workers < CORES; workers *= 2)); do
+    worker_counts="$worker_counts $workers"
+done
+worker_counts="$worker_counts $CORES"
+
+for workers in $worker_counts; do
+    echo "== $workers worker(s) on $CORES core(s)"
+    WEB_CONCURRENCY=$workers WEB_BIND=127.0.0.1:$PORT \
+        gunicorn app.asgi:application --config gunicorn.conf.py \
+        --access-logfile /dev/null --error-logfile /dev/null &
+    server=$!
+
+    until python -c "import socket; socket.create_connection(('127.0.0.1', $PORT), 1)" 2>/dev/null; do
+        sleep 0.5
+    done
+
+    python manage.py load_test --base-url "http://127.0.0.1:$PORT" --username "$USERNAME" "$@" || true
+
+    kill $server
+    wait $server 2>/dev/null || true
+done
@@ -3,6 +3,8 @@ from django.contrib.auth.admin import UserAdmin
 from meal_together.models.users import CustomUser
 from meal_together.models.restaurants import Tag, Restaurant, MenuItem
 from meal_together.models.sessions import MealSession, Order
+from meal_together.models.credits import CreditBalance
+from meal_together.models.outbox import EmailEvent
 
 admin.site.register(CustomUser, UserAdmin)
 admin.site.register(Tag)
@@ -10,3 +12,5 @@ admin.site.register(Restaurant)
 admin.site.register(MenuItem)
 admin.site.register(MealSession)
 admin.site.register(Order)
+admin.site.register(CreditBalance)
+admin.site.register(EmailEvent)
@@ -1,16 +1,34 @@
 from django.apps import AppConfig
 from django.db.models.signals import post_migrate
 
+
+def schedule_sweeps(sender, **kwargs):
+    from background_task.models import Task
+    from meal_together.tasks import (
+        SWEEPING_QUEUE,
+        dispatch_pending_email_events,
+        send_deadline_notifications,
+    )
+
+    sweeps = (send_deadline_notifications, dispatch_pending_email_events)
+    # Sweeps scheduled before they moved to the sweeping queue are no longer
+    # run by any process_tasks program
+    Task.objects.filter(
+        task_name__in=[sweep.name for sweep in sweeps], queue__isnull=True
+    ).delete()
+    # migrate runs on every start, schedule each sweep only once
+    for sweep in sweeps:
+        if not Task.objects.filter(task_name=sweep.name, queue=SWEEPING_QUEUE).exists():
+            sweep(repeat=60)
+
+
 class MealTogetherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'meal_together'
 
     def ready(self):
-        
-        
-        from django.dispatch import receiver       
+        from meal_together import signals  # noqa: F401
 
-        @receiver(post_migrate)
-        def schedule_tasks(sender, **kwargs):
-            from meal_together.tasks import send_deadline_notifications
-            send_deadline_notifications(repeat=60)
+        # A module level receiver, signals only keep weak references and a
+        # function defined in here would be collected once ready() returns
+        post_migrate.connect(schedule_sweeps, sender=self)
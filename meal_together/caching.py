@@ -0,0 +1,23 @@
+from uuid import uuid4
+from django.core.cache import cache
+
+
+def get_cache_version(key: str) -> str:
+    """
+    Current version stored under `key`, created on first use. Cached
+    entries built from versioned data put the version in their own key.
+    """
+    version = cache.get(key)
+    if version is None:
+        # add() keeps a version another process created meanwhile
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(key: str) -> None:
+    """
+    Move `key` to a new version. Entries cached under the old one are never
+    read again and simply expire.
+    """
+    cache.set(key, uuid4().hex, None)
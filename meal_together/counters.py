@@ -0,0 +1,110 @@
+from decimal import Decimal
+from typing import Iterable, List
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+from meal_together.models.sessions import MealSession, Order
+
+Participant = MealSession.participants.through
+
+
+def adjust_session_totals(
+    session_id: int, spent_delta: Decimal = Decimal("0"), orders_delta: int = 0
+) -> None:
+    """
+    Shift the session's stored totals with F() expressions, so concurrent
+    order changes add up instead of overwriting each other. Any change to
+    an order also moves the session to a new version.
+    """
+    MealSession.objects.filter(pk=session_id).update(
+        total_spent=F("total_spent") + spent_delta,
+        order_count=F("order_count") + orders_delta,
+        version=F("version") + 1,
+        updated_at=now(),
+    )
+
+
+def touch_session(session_id: int) -> None:
+    adjust_session_totals(session_id)
+
+
+def _participant_count_subquery():
+    return Coalesce(
+        Subquery(
+            Participant.objects.filter(mealsession=OuterRef("pk"))
+            .order_by()
+            .values("mealsession")
+            .annotate(count=Count("pk"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def refresh_participant_count(session_ids: Iterable[int]) -> None:
+    MealSession.objects.filter(pk__in=list(session_ids)).update(
+        participant_count=_participant_count_subquery(),
+        version=F("version") + 1,
+        updated_at=now(),
+    )
+
+
+def expected_totals():
+    """
+    Total spent, order count and participant count of each session as
+    computed from its orders and participants.
+    """
+    orders = Order.objects.filter(session=OuterRef("pk")).order_by().values("session")
+    return {
+        "expected_total_spent": Coalesce(
+            Subquery(
+                orders.annotate(total=Sum("total_price")).values("total"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        "expected_order_count": Coalesce(
+            Subquery(
+                orders.annotate(count=Count("pk")).values("count"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ),
+        "expected_participant_count": _participant_count_subquery(),
+    }
+
+
+def find_session_drift() -> List[MealSession]:
+    """
+    Sessions whose stored counters differ from their orders and participants,
+    annotated with the expected values.
+    """
+    return list(
+        MealSession.objects.annotate(**expected_totals())
+        .filter(
+            ~Q(total_spent=F("expected_total_spent"))
+            | ~Q(order_count=F("expected_order_count"))
+            | ~Q(participant_count=F("expected_participant_count"))
+        )
+        .order_by("pk")
+    )
+
+
+def recompute_session_totals(session_ids: Iterable[int] = None) -> int:
+    """
+    Rewrite the counters from orders and participants in a single UPDATE.
+    Returns the number of sessions updated.
+    """
+    sessions = MealSession.objects.all()
+    if session_ids is not None:
+        sessions = sessions.filter(pk__in=list(session_ids))
+    expected = expected_totals()
+    return sessions.update(
+        total_spent=expected["expected_total_spent"],
+        order_count=expected["expected_order_count"],
+        participant_count=expected["expected_participant_count"],
+        version=F("version") + 1,
+        updated_at=now(),
+    )
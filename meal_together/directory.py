@@ -0,0 +1,98 @@
+import hashlib
+from typing import Any, Dict, List
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q, QuerySet
+from meal_together.caching import bump_cache_version, get_cache_version
+from meal_together.models.restaurants import Restaurant, Tag
+from meal_together.search import prefix_search_query, search_words
+
+DIRECTORY_CACHE_TIMEOUT = 60 * 60 * 24
+DIRECTORY_VERSION_KEY = "restaurant_directory_version"
+RESTAURANTS_PER_PAGE = 24
+
+
+def get_directory_version() -> str:
+    return get_cache_version(DIRECTORY_VERSION_KEY)
+
+
+def invalidate_directory() -> None:
+    """
+    Move the directory to a new version after any change to restaurants or
+    tags, every cached page and the tag list become stale at once.
+    """
+    bump_cache_version(DIRECTORY_VERSION_KEY)
+
+
+def search_restaurants(query: str = "", tag: str = "") -> QuerySet:
+    """
+    Restaurants with every word of the query in their name or address, and
+    carrying the tag if one is given. PostgreSQL matches word prefixes with
+    the full-text index of migration 0008, other databases fall back to
+    substring matches.
+    """
+    restaurants = Restaurant.objects.all()
+    words = search_words(query)
+    if words and connection.vendor == "postgresql":
+        restaurants = restaurants.annotate(
+            search=SearchVector("name", "address", config="simple")
+        ).filter(search=prefix_search_query(words))
+    else:
+        for word in words:
+            restaurants = restaurants.filter(
+                Q(name__icontains=word) | Q(address__icontains=word)
+            )
+    if tag:
+        restaurants = restaurants.filter(tags__name=tag)
+    return restaurants.order_by("name", "pk")
+
+
+def build_directory_page(query: str, tag: str, number: int) -> Dict[str, Any]:
+    paginator = Paginator(search_restaurants(query, tag), RESTAURANTS_PER_PAGE)
+    page = paginator.get_page(number)
+    restaurants = page.object_list.prefetch_related("tags")
+    return {
+        "restaurants": [
+            {
+                "id": restaurant.id,
+                "name": restaurant.name,
+                "address": restaurant.address,
+                "tags": sorted(tag.name for tag in restaurant.tags.all()),
+            }
+            for restaurant in restaurants
+        ],
+        "count": paginator.count,
+        "number": page.number,
+        "num_pages": paginator.num_pages,
+    }
+
+
+def get_cached_directory_page(query: str, tag: str, number: int) -> Dict[str, Any]:
+    """
+    One page of the filtered directory as plain data, served from the cache
+    when possible. Filters are hashed into the key, since they are user input.
+    """
+    filters = hashlib.md5(f"{query.lower()}\0{tag}\0{number}".encode()).hexdigest()
+    key = f"restaurant_directory:{get_directory_version()}:{filters}"
+    page = cache.get(key)
+    if page is None:
+        page = build_directory_page(query, tag, number)
+        cache.set(key, page, DIRECTORY_CACHE_TIMEOUT)
+    return page
+
+
+def get_cached_tag_names() -> List[str]:
+    """Names of the tags in use, for the directory filter."""
+    key = f"restaurant_directory:{get_directory_version()}:tags"
+    names = cache.get(key)
+    if names is None:
+        names = list(
+            Tag.objects.filter(restaurants__isnull=False)
+            .distinct()
+            .order_by("name")
+            .values_list("name", flat=True)
+        )
+        cache.set(key, names, DIRECTORY_CACHE_TIMEOUT)
+    return names
@@ -1,9 +1,9 @@
 from django.utils.http import urlsafe_base64_encode
 from meal_together.helpers import account_activation_token
 from django.utils.encoding import force_bytes
-from django.template.loader import render_to_string
+from django.template.loader import get_template, render_to_string
 from django.urls import reverse
-from .tasks import send_email_task
+from .mailer import build_payload, queue_email, queue_emails
 
 
 
@@ -18,7 +18,7 @@ def send_activation_link(current_site, user):
         context,
     )
 
-    send_email_task.delay(
+    queue_email(
         subject,
         message,
         [user.email],
@@ -26,25 +26,33 @@ def send_activation_link(current_site, user):
 
 
 def send_invitation_email(current_site, invited_users, session):
+    """
+    Send every invitee their own message. The template is compiled once
+    and only rendered per recipient with their name and order link.
+    """
     session_link = f"http://{current_site}/sessions/{session.id}"
     subject = f"You've been invited to the meal session: {session.name}"
-    context = {
-        "session": session,
-        "session_link": session_link
-    }
-    message = render_to_string(
-        "emails/session_invitation_email.html",
-        context,
-    )
-    recipient_list = [
-        user.email for user in invited_users if user.email and user != session.creator
+    template = get_template("emails/session_invitation_email.html")
+
+    payloads = [
+        build_payload(
+            subject,
+            template.render(
+                {
+                    "session": session,
+                    "session_link": session_link,
+                    "user": user,
+                    "order_link": f"http://{current_site}/sessions/{session.id}/create_order/{user.id}/",
+                }
+            ),
+            [user.email],
+        )
+        for user in invited_users
+        # As before, the creator is a participant but is not invited
+        if user.email and user.id != session.creator_id
     ]
 
-    send_email_task.delay(
-        subject,
-        message,
-        recipient_list,
-    )
+    queue_emails(payloads)
 
 
 def send_session_update_email(current_site, changes, session):
@@ -63,27 +71,28 @@ def send_session_update_email(current_site, changes, session):
         if participant.email and participant.email != session.creator.email
     ]
 
-    send_email_task.delay(
+    queue_email(
         subject,
         message,
         recipient_list,
     )
 
 
-def send_order_update_email(current_site, changes, order):
+def send_order_update_email(current_site, changes, session, user, order_id):
     context = {
         "changes": changes,
-        "order_id": order.id,
-        "session_name": order.session.name,
-        "order_link": f"http://{current_site}/sessions/{order.session.id}/",
+        "user": user,
+        "order_id": order_id,
+        "session_name": session.name,
+        "order_link": f"http://{current_site}/sessions/{session.id}/",
     }
 
     message = render_to_string("emails/order_update_notification.html", context)
 
-    subject = f"Your order has been updated in the session: {order.session.name}"
-    recipient_list = [order.user.email] if order.user.email else []
+    subject = f"Your order has been updated in the session: {session.name}"
+    recipient_list = [user.email] if user.email else []
 
-    send_email_task.delay(
+    queue_email(
         subject,
         message,
         recipient_list,
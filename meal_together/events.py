@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "order_created"
+ORDER_UPDATED = "order_updated"
+ORDER_CANCELED = "order_canceled"
+
+# Subscriptions are async context managers: the channel is listened to from
+# entering the block, and the iterator they give yields None after this many
+# seconds without an event so the stream can send a keep-alive comment
+HEARTBEAT_INTERVAL = 15
+
+
+def session_channel(session_id: int) -> str:
+    return f"meal_together:session:{session_id}"
+
+
+class RedisEventBackend:
+    """
+    Pub/sub over Redis, shared by every web process.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    def publish(self, channel: str, message: str) -> None:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+
+        async def messages() -> AsyncIterator[Optional[str]]:
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=HEARTBEAT_INTERVAL
+                )
+                yield message["data"].decode() if message else None
+
+        try:
+            yield messages()
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class InProcessEventBackend:
+    """
+    Pub/sub within a single process, for tests and development servers.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        loop, queue = asyncio.get_running_loop(), asyncio.Queue()
+        with self._lock:
+            self._subscribers[channel].add((loop, queue))
+
+        async def messages() -> AsyncIterator[Optional[str]]:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield None
+
+        try:
+            yield messages()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard((loop, queue))
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+_backend = None
+
+
+def get_event_backend():
+    global _backend
+    if _backend is None:
+        if settings.SESSION_EVENTS_BACKEND == "memory":
+            _backend = InProcessEventBackend()
+        else:
+            _backend = RedisEventBackend(settings.CELERY_BROKER_URL)
+    return _backend
+
+
+def publish_session_event(session_id: int, event: str, data: Dict) -> None:
+    """
+    Announce an order change to everyone watching the session, once the
+    surrounding transaction has committed.
+    """
+    message = json.dumps({"event": event, **data}, cls=DjangoJSONEncoder)
+
+    def publish():
+        try:
+            get_event_backend().publish(session_channel(session_id), message)
+        except Exception:
+            # Live updates are best effort, the page still works without them
+            logger.exception("Publishing %s for session %s failed", event, session_id)
+
+    transaction.on_commit(publish)
+
+
+def publish_order_event(event: str, order, user) -> None:
+    """
+    Announce an order change with everything the session page shows about
+    the order, so watching pages update in place without a request of their
+    own. Costs the publisher one query for the order lines.
+    """
+    items = []
+    if event != ORDER_CANCELED:
+        items = [
+            {
+                "name": item.menu_item.name,
+                "quantity": item.quantity,
+                "total_price": item.item_total_price,
+                "note": item.note or "",
+            }
+            for item in order.orderitem_set.select_related("menu_item").order_by("pk")
+        ]
+    publish_session_event(
+        order.session_id,
+        event,
+        {
+            "order_id": order.id,
+            "user": {"id": user.id, "first_name": user.first_name, "last_name": user.last_name},
+            "total_price": order.total_price,
+            "payment_method": order.payment_method,
+            "items": items,
+        },
+    )
@@ -0,0 +1,274 @@
+import csv
+import tempfile
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, Iterator, List
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.timezone import localtime
+from xlsxwriter import Workbook
+from meal_together.helpers import (
+    aggregate_order_items,
+    get_orders_as_creditor,
+    get_orders_as_debtor,
+    iterate_in_thread,
+)
+from meal_together.models.credits import CreditBalance
+from meal_together.models.sessions import MealSession, Order, OrderItem
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_CHUNK_SIZE = 2000
+FILE_BLOCK_SIZE = 64 * 1024
+CENTS = Decimal("0.01")
+
+
+class Sheet:
+    """
+    A titled table of an export. Rows are produced lazily, so a sheet over
+    years of orders is never held in memory.
+    """
+
+    def __init__(self, title: str, header: List[str], rows: Iterable[List]):
+        self.title = title
+        self.header = header
+        self.rows = rows
+
+
+def local(value):
+    # Spreadsheets have no time zones, write the wall clock time
+    return localtime(value).replace(tzinfo=None, microsecond=0)
+
+
+def session_order_rows(session: MealSession) -> Iterator[List]:
+    orders = (
+        Order.objects.filter(session=session)
+        .order_by("user__last_name", "user__first_name", "pk")
+        .values_list(
+            "user__first_name", "user__last_name", "user__email", "payment_method", "total_price"
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for first_name, last_name, email, payment_method, total_price in orders:
+        yield [f"{first_name} {last_name}", email, payment_method, total_price]
+    yield ["Total", "", "", session.total_spent]
+
+
+def session_item_rows(session: MealSession) -> Iterator[List]:
+    items = (
+        OrderItem.objects.filter(order__session=session)
+        .order_by("order__user__last_name", "order__user__first_name", "order_id", "pk")
+        .values_list(
+            "order__user__first_name",
+            "order__user__last_name",
+            "menu_item__item_type",
+            "menu_item__name",
+            "quantity",
+            "unit_price",
+            "note",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for first_name, last_name, item_type, name, quantity, unit_price, note in items:
+        yield [
+            f"{first_name} {last_name}",
+            item_type,
+            name,
+            quantity,
+            unit_price,
+            unit_price * quantity,
+            note or "",
+        ]
+
+
+def aggregated_item_rows(session: MealSession) -> Iterator[List]:
+    for item in aggregate_order_items(session):
+        # SQLite returns the sum of products with extra decimal places
+        yield [item["name"], item["total_quantity"], item["total_price"].quantize(CENTS)]
+
+
+def session_summary_sheets(session: MealSession) -> List[Sheet]:
+    """The tables of session_summary: orders, their items and item totals."""
+    return [
+        Sheet(
+            "Orders",
+            ["Participant", "Email", "Payment method", "Total"],
+            session_order_rows(session),
+        ),
+        Sheet(
+            "Items",
+            ["Participant", "Type", "Item", "Quantity", "Unit price", "Total", "Note"],
+            session_item_rows(session),
+        ),
+        Sheet(
+            "Aggregated items",
+            ["Item", "Quantity", "Total"],
+            aggregated_item_rows(session),
+        ),
+    ]
+
+
+def history_order_rows(user) -> Iterator[List]:
+    items = (
+        OrderItem.objects.filter(order__user=user)
+        .order_by("order__session__delivery_time", "order_id", "pk")
+        .values_list(
+            "order__session__delivery_time",
+            "order__session__name",
+            "order__session__restaurant__name",
+            "order__payment_method",
+            "menu_item__name",
+            "quantity",
+            "unit_price",
+            "note",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for delivery_time, session, restaurant, payment_method, name, quantity, unit_price, note in items:
+        yield [
+            local(delivery_time),
+            session,
+            restaurant,
+            payment_method,
+            name,
+            quantity,
+            unit_price,
+            unit_price * quantity,
+            note or "",
+        ]
+
+
+def history_credit_rows(user) -> Iterator[List]:
+    # Positive amounts are owed by the user, as in CreditBalance
+    orders = (
+        (get_orders_as_debtor(user) | get_orders_as_creditor(user))
+        .order_by("session__delivery_time", "pk")
+        .values_list(
+            "session__delivery_time",
+            "session__name",
+            "user_id",
+            "user__username",
+            "session__creator__username",
+            "total_price",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for delivery_time, session, debtor_id, debtor, creditor, amount in orders:
+        if debtor_id == user.id:
+            yield [local(delivery_time), session, creditor, amount]
+        else:
+            yield [local(delivery_time), session, debtor, -amount]
+
+
+def history_balance_rows(user) -> Iterator[List]:
+    balances = (
+        CreditBalance.objects.filter(user=user)
+        .exclude(balance=0)
+        .order_by("counterparty__username")
+        .values_list("counterparty__username", "balance")
+    )
+    for counterparty, balance in balances:
+        yield [counterparty, balance]
+
+
+def order_history_sheets(user) -> List[Sheet]:
+    """Every item the user ordered, every credit order and current balances."""
+    return [
+        Sheet(
+            "Orders",
+            [
+                "Delivery time",
+                "Session",
+                "Restaurant",
+                "Payment method",
+                "Item",
+                "Quantity",
+                "Unit price",
+                "Total",
+                "Note",
+            ],
+            history_order_rows(user),
+        ),
+        Sheet(
+            "Credit",
+            ["Delivery time", "Session", "Counterparty", "Amount"],
+            history_credit_rows(user),
+        ),
+        Sheet("Balances", ["Counterparty", "Balance"], history_balance_rows(user)),
+    ]
+
+
+class Echo:
+    """A file-like object handing written lines back to the caller."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def write_csv(sheets: List[Sheet]) -> Iterator[str]:
+    """
+    Write the sheets one after another, each under its title and separated
+    by an empty line, in chunks of EXPORT_CHUNK_SIZE rows.
+    """
+    writer = csv.writer(Echo())
+    for index, sheet in enumerate(sheets):
+        chunk = ["\r\n"] if index else []
+        chunk += [writer.writerow([sheet.title]), writer.writerow(sheet.header)]
+        for row in sheet.rows:
+            chunk.append(writer.writerow(row))
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+
+def write_xlsx(sheets: List[Sheet]):
+    """
+    Write the sheets to a temporary workbook file and return it rewound. In
+    constant memory mode each row is flushed to disk once the next starts.
+    """
+    output = tempfile.TemporaryFile()
+    workbook = Workbook(
+        output,
+        {
+            "constant_memory": True,
+            "default_date_format": "yyyy-mm-dd hh:mm",
+        },
+    )
+    bold = workbook.add_format({"bold": True})
+    for sheet in sheets:
+        worksheet = workbook.add_worksheet(sheet.title)
+        worksheet.write_row(0, 0, sheet.header, bold)
+        for number, row in enumerate(sheet.rows, start=1):
+            worksheet.write_row(number, 0, row)
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def read_file(file) -> Iterator[bytes]:
+    with file:
+        yield from iter(lambda: file.read(FILE_BLOCK_SIZE), b"")
+
+
+async def stream_export(sheets: List[Sheet], file_format: str) -> AsyncIterator:
+    """
+    Stream the sheets as CSV, or as a workbook once it has been written.
+    The queries run on the request's sync thread.
+    """
+    if file_format == "csv":
+        chunks = write_csv(sheets)
+    else:
+        chunks = read_file(await sync_to_async(write_xlsx)(sheets))
+    async for chunk in iterate_in_thread(chunks):
+        yield chunk
+
+
+def export_response(sheets: List[Sheet], file_format: str, filename: str) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(
+        stream_export(sheets, file_format), content_type=EXPORT_FORMATS[file_format]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{file_format}"'
+    return response
@@ -31,3 +31,15 @@ class MenuItemForm(forms.ModelForm):
     class Meta:
         model = MenuItem
         fields = ['item_type', 'name', 'price', 'currency']
+
+
+class MenuImportForm(forms.Form):
+    file = forms.FileField(
+        help_text='Columns item_type, name, price and optionally currency. '
+                  'Items with the same type and name are updated.',
+    )
+    file_format = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('json', 'JSON')],
+        initial='csv',
+        label='Format',
+    )
@@ -1,7 +1,8 @@
 from django import forms
 from django.utils.timezone import localtime
 from meal_together.models.sessions import MealSession, Order, OrderItem
-from django.forms import inlineformset_factory
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, inlineformset_factory
 from meal_together.models.restaurants import MenuItem
 from django.contrib.auth import get_user_model
 
@@ -72,20 +73,128 @@ class OrderForm(forms.ModelForm):
             'payment_method': forms.Select(attrs={'class': 'form-control'}),
         }
 
+class MenuItemChoiceField(forms.ModelChoiceField):
+    """
+    Menu item choice that can be given an already loaded menu, so rendering
+    and validation look items up in memory instead of querying per form.
+    """
+    menu_by_pk = None
+
+    def set_menu(self, menu_items, choices):
+        self.menu_by_pk = {str(item.pk): item for item in menu_items}
+        self.choices = choices
+
+    def to_python(self, value):
+        if self.menu_by_pk is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.menu_by_pk[str(value)]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
 class OrderItemForm(forms.ModelForm):
     class Meta:
         model = OrderItem
         fields = ['menu_item', 'quantity', 'note']
+        field_classes = {
+            'menu_item': MenuItemChoiceField,
+        }
         widgets = {
             'menu_item': forms.Select(attrs={'class': 'form-control'}),
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
             'note': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
         }
 
+    def __init__(self, *args, menu=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Current price of the chosen item, read from the database by the
+        # formset, as the shared menu may be cached by another process
+        self.current_price = None
+        if menu is not None:
+            self.fields['menu_item'].set_menu(menu['items'], menu['choices'])
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.fields['menu_item'].menu_by_pk is not None:
+            # BaseOrderItemFormSet.clean checks that the chosen items still
+            # exist in one query, skip the per-row query of the foreign key
+            exclude.add('menu_item')
+        return exclude
+
+    def needs_price(self):
+        return self.instance.unit_price is None or 'menu_item' in self.changed_data
+
+    def save(self, commit=True):
+        # Snapshot the price of newly chosen items only, quantity or note
+        # edits keep the price the item was ordered at
+        if self.needs_price():
+            if self.current_price is None:
+                self.current_price = self.instance.menu_item.price
+            self.instance.unit_price = self.current_price
+        return super().save(commit)
+
+
+class BaseOrderItemFormSet(BaseInlineFormSet):
+    """
+    Shares one evaluated restaurant menu (see meal_together.menus) between
+    all forms of the formset.
+    """
+    def __init__(self, *args, menu=None, **kwargs):
+        self.menu = menu
+        kwargs.setdefault('queryset', OrderItem.objects.select_related('menu_item'))
+        super().__init__(*args, **kwargs)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['menu'] = self.menu
+        return kwargs
+
+    def clean(self):
+        super().clean()
+        if self.menu is None:
+            return
+        # Items picked from the shared menu are checked against the database
+        # in one query for all forms: they must still exist, and are priced
+        # as they are now rather than as cached
+        priced_forms = [
+            form for form in self.forms
+            if form.has_changed()
+            and not self._should_delete_form(form)
+            and form.cleaned_data.get('menu_item') is not None
+            and form.needs_price()
+        ]
+        if not priced_forms:
+            return
+        prices = dict(
+            MenuItem.objects.filter(
+                pk__in={form.cleaned_data['menu_item'].pk for form in priced_forms}
+            ).values_list('pk', 'price')
+        )
+        for form in priced_forms:
+            menu_item = form.cleaned_data['menu_item']
+            if menu_item.pk in prices:
+                form.current_price = prices[menu_item.pk]
+            else:
+                form.add_error(
+                    'menu_item',
+                    ValidationError(
+                        form.fields['menu_item'].error_messages['invalid_choice'],
+                        code='invalid_choice',
+                        params={'value': menu_item.pk},
+                    ),
+                )
+
+
 OrderItemFormSet = inlineformset_factory(
     Order,
     OrderItem,
     form=OrderItemForm,
+    formset=BaseOrderItemFormSet,
     extra=3,
     can_delete=True
 )
\ No newline at end of file
@@ -1,9 +1,17 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.db.models import QuerySet, Sum
+from django.core.paginator import Page, Paginator
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, QuerySet, Sum
+from django.db.models.functions import Abs
 from meal_together.models.sessions import MealSession, Order, OrderItem
+from meal_together.models.credits import CreditBalance
+from meal_together.ledger import get_credit_contribution, update_credit_ledger
+from meal_together.counters import adjust_session_totals
 from six import text_type
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, AsyncIterator, Callable, Iterable
 from collections import defaultdict
+from decimal import Decimal
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -137,29 +145,86 @@ def get_order_changes(
     return changes
 
 
+async def run_queries(*funcs: Callable) -> List[Any]:
+    """
+    Run blocking query callables one after another in a single hop to the
+    request's sync thread and return their results in order. They use the
+    request's own database connection, inside its transaction if any, and
+    hold no extra connections.
+    """
+    return await sync_to_async(lambda: [func() for func in funcs])()
+
+
+def load_page(queryset: QuerySet, per_page: int, number) -> Page:
+    """
+    Like Paginator.get_page, with the page's rows fetched right away so it
+    can be built off the event loop and rendered later.
+    """
+    page = Paginator(queryset, per_page).get_page(number)
+    page.object_list = list(page.object_list)
+    return page
+
+
+async def iterate_in_thread(iterable: Iterable) -> AsyncIterator:
+    """
+    Consume a blocking iterator from async code, one item per hop to the
+    request's sync thread, so a server-side cursor stays on its connection.
+    Under ASGI StreamingHttpResponse would read a sync iterator into a list.
+    """
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        item = await sync_to_async(next)(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def get_session_orders(session: MealSession) -> QuerySet:
+    """
+    All orders of the session with their items and menu items loaded
+    up front, so iterating them never hits the database again.
+    """
+    return session.orders.prefetch_related(
+        Prefetch(
+            "orderitem_set",
+            queryset=OrderItem.objects.select_related("menu_item").order_by("pk"),
+        )
+    ).order_by("pk")
+
+
 def process_participants(
-    session, orders_by_user=None, include_creator_info=False
+    session, include_items=False, include_creator_info=False
+) -> List[Dict[str, Union[Any, List[Any], float, bool]]]:
+    """
+    Build per-participant order data for the session with a fixed number of
+    queries: participants, orders, order items (menu items joined in).
+    """
+    return build_participants_data(
+        session,
+        session.participants.all(),
+        get_session_orders(session),
+        include_items=include_items,
+        include_creator_info=include_creator_info,
+    )
+
+
+def build_participants_data(
+    session, participants, orders, include_items=False, include_creator_info=False
 ) -> List[Dict[str, Union[Any, List[Any], float, bool]]]:
+    """
+    Group already loaded orders by participant. Lets async views load the
+    participants and the orders together in one hop to the sync thread.
+    """
+    orders_by_user = defaultdict(list)
+    for order in orders:
+        orders_by_user[order.user_id].append(order)
+
     participants_data = []
 
-    for participant in session.participants.all():
-        # Fetch orders based on whether orders_by_user is provided
-        user_orders = (
-            orders_by_user.get(participant.id, [])
-            if orders_by_user
-            else participant.orders.filter(session=session)
-        )
+    for participant in participants:
+        user_orders = orders_by_user.get(participant.id, [])
         total_spent = sum(order.total_price for order in user_orders)
-        items = []
-        payment_methods = []
-
-        # If orders_by_user is not provided, fetch items from orders
-        if not orders_by_user:
-            for order in user_orders:
-                items.extend(order.orderitem_set.all())
-        else:
-            # Collect unique payment methods
-            payment_methods = list(set(order.payment_method for order in user_orders))
 
         # Base participant data
         participant_data = {
@@ -169,39 +234,56 @@ def process_participants(
         }
 
         # Add additional details if applicable
-        if not orders_by_user:
-            participant_data["items"] = items
+        if include_items:
+            participant_data["items"] = [
+                item for order in user_orders for item in order.orderitem_set.all()
+            ]
         if include_creator_info:
-            participant_data["is_creator"] = participant == session.creator
-            participant_data["payment_methods"] = payment_methods
+            participant_data["is_creator"] = participant.id == session.creator_id
+            # Collect unique payment methods
+            participant_data["payment_methods"] = list(
+                set(order.payment_method for order in user_orders)
+            )
 
         participants_data.append(participant_data)
 
     return participants_data
 
 
+def update_order_total(order: Order) -> Decimal:
+    """
+    Recompute the order total with one aggregate over its items and write
+    only that column, keeping the credit ledger and session totals in step.
+    """
+    with transaction.atomic():
+        # Take the deltas from the stored row, under a lock: `order` may have
+        # been loaded before another edit of the same order committed
+        stored = (
+            Order.objects.select_for_update(of=("self",))
+            .select_related("session")
+            .get(pk=order.pk)
+        )
+        total = order.orderitem_set.aggregate(
+            total=Sum(F("unit_price") * F("quantity"))
+        )["total"] or Decimal("0")
+        previous_total = stored.total_price
+        previous_contribution = get_credit_contribution(stored)
+        Order.objects.filter(pk=order.pk).update(total_price=total)
+        order.total_price = stored.total_price = total
+        update_credit_ledger(previous_contribution, get_credit_contribution(stored))
+        adjust_session_totals(order.session_id, total - previous_total)
+    return total
+
+
 def aggregate_order_items(
     session: MealSession,
 ) -> List[Dict[str, Union[str, int, float]]]:
     """
     Aggregate all order items in the session by item name.
     """
-    aggregated_items = defaultdict(lambda: {"quantity": 0, "total_price": 0})
-    all_order_items = OrderItem.objects.filter(order__session=session)
-    for item in all_order_items:
-        key = item.menu_item.name
-        aggregated_items[key]["quantity"] += item.quantity
-        aggregated_items[key]["total_price"] += item.menu_item.price * item.quantity
-
-    # Convert the aggregated dictionary to a list
-    return [
-        {
-            "name": key,
-            "quantity": value["quantity"],
-            "total_price": value["total_price"],
-        }
-        for key, value in aggregated_items.items()
-    ]
+    return list(
+        OrderItem.objects.filter(order__session=session).aggregate_by_menu_item()
+    )
 
 
 def get_orders_as_debtor(user) -> QuerySet:
@@ -216,33 +298,28 @@ def get_orders_as_creditor(user) -> QuerySet:
     )
 
 
-def calculate_balances(
-    orders_as_debtor: QuerySet, orders_as_creditor: QuerySet
-) -> Dict[int, float]:
-    balances = {}
-    users_current_user_owes = orders_as_debtor.values("session__creator").annotate(
-        total_owed=Sum("total_price")
-    )
-    for item in users_current_user_owes:
-        user_id = item["session__creator"]
-        amount = item["total_owed"]
-        balances[user_id] = balances.get(user_id, 0) + amount
-
-    users_who_owe_current_user = orders_as_creditor.values("user").annotate(
-        total_owed=Sum("total_price")
-    )
-    for item in users_who_owe_current_user:
-        user_id = item["user"]
-        amount = item["total_owed"]
-        balances[user_id] = balances.get(user_id, 0) - amount
+BALANCE_ORDERINGS = {
+    "amount": [Abs("balance").desc(), "counterparty__username"],
+    "owed": ["-balance", "counterparty__username"],
+    "owing": ["balance", "counterparty__username"],
+    "name": ["counterparty__username"],
+}
 
-    return balances
 
-
-def format_balances_for_view(balances: Dict[int, float]) -> List:
-    balances_list = []
-    for user_id, balance in balances.items():
-        if balance != 0:
-            user = User.objects.get(pk=user_id)
-            balances_list.append({"user": user, "balance": balance})
-    return balances_list
+def get_credit_balances(
+    user, min_amount: Decimal = Decimal("0"), ordering: str = "amount"
+) -> QuerySet:
+    """
+    Ledger rows of the user with counterparties joined in, hiding balances
+    smaller than `min_amount` in either direction.
+    """
+    balances = CreditBalance.objects.filter(user=user).select_related("counterparty")
+    if min_amount > 0:
+        balances = balances.filter(
+            Q(balance__gte=min_amount) | Q(balance__lte=-min_amount)
+        )
+    else:
+        balances = balances.exclude(balance=0)
+    return balances.order_by(
+        *BALANCE_ORDERINGS.get(ordering, BALANCE_ORDERINGS["amount"])
+    )
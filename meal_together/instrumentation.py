@@ -0,0 +1,248 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request being handled. Context variables follow the request
+# into sync_to_async threads, including the one run_queries uses.
+current_metrics: ContextVar[Optional["RequestMetrics"]] = ContextVar(
+    "current_metrics", default=None
+)
+
+# Sampled requests of this process, newest last
+recent_requests = deque(maxlen=settings.REQUEST_METRICS_BUFFER_SIZE)
+
+
+class RequestMetrics:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.started_at = now()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_query = None
+        self.slowest_query_time = 0.0
+        self.template_time = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, sql: str, duration: float) -> None:
+        with self._lock:
+            self.query_count += 1
+            self.db_time += duration
+            if duration > self.slowest_query_time:
+                self.slowest_query = sql
+                self.slowest_query_time = duration
+
+    def add_template_time(self, duration: float) -> None:
+        with self._lock:
+            self.template_time += duration
+
+    def as_dict(self, view: str, status: int, total_time: float) -> Dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "view": view,
+            "status": status,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round(total_time * 1000, 2),
+            "queries": self.query_count,
+            "db_ms": round(self.db_time * 1000, 2),
+            "template_ms": round(self.template_time * 1000, 2),
+            "slowest_query_ms": round(self.slowest_query_time * 1000, 2),
+            "slowest_query": self.slowest_query,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection) -> None:
+    # Pooled connections are handed out again and again, wrap them only once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def record_new_connection(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = current_metrics.get()
+            if metrics is not None:
+                metrics.add_template_time(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render for the
+    request metrics.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def get_thresholds(view: str) -> Dict[str, float]:
+    thresholds = settings.REQUEST_METRICS_THRESHOLDS
+    return {**thresholds.get("default", {}), **thresholds.get(view, {})}
+
+
+def exceeded_thresholds(record: Dict) -> List[str]:
+    return [
+        f"{key} {record[key]} > {limit}"
+        for key, limit in get_thresholds(record["view"]).items()
+        if record[key] > limit
+    ]
+
+
+def server_timing(record: Dict) -> str:
+    return (
+        f'db;dur={record["db_ms"]};desc="{record["queries"]} queries", '
+        f'tpl;dur={record["template_ms"]}, '
+        f'total;dur={record["total_ms"]}'
+    )
+
+
+def start_request(request):
+    # Connections opened before this module was loaded missed the signal
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    metrics = RequestMetrics(request)
+    return metrics, current_metrics.set(metrics), time.perf_counter()
+
+
+def measure_chunks(chunks, metrics: RequestMetrics):
+    # A generator shares its caller's context, so set the metrics for the
+    # production of each chunk only
+    iterator = iter(chunks)
+    while True:
+        token = current_metrics.set(metrics)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            current_metrics.reset(token)
+        yield chunk
+
+
+async def ameasure_chunks(chunks, metrics: RequestMetrics):
+    iterator = aiter(chunks)
+    while True:
+        token = current_metrics.set(metrics)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            current_metrics.reset(token)
+        yield chunk
+
+
+def build_record(request, response, metrics: RequestMetrics, started: float) -> Dict:
+    match = request.resolver_match
+    view = match.view_name if match else ""
+    return metrics.as_dict(view, response.status_code, time.perf_counter() - started)
+
+
+def record_request(request, response, metrics: RequestMetrics, started: float) -> None:
+    record = build_record(request, response, metrics, started)
+    # For in-process callers such as the benchmark command
+    response.request_metrics = record
+    logger.info(json.dumps(record))
+
+    exceeded = exceeded_thresholds(record)
+    if exceeded:
+        logger.warning(
+            "%s %s exceeded thresholds: %s", record["method"], record["path"], ", ".join(exceeded)
+        )
+    # Requests over a threshold are always kept, the rest are sampled
+    if exceeded or random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:
+        recent_requests.append(record)
+
+
+def finish_request(request, response, metrics: RequestMetrics, started: float) -> None:
+    # Headers go out before any of the body, so for streaming responses the
+    # Server-Timing header covers the view only
+    response["Server-Timing"] = server_timing(build_record(request, response, metrics, started))
+    if not response.streaming:
+        record_request(request, response, metrics, started)
+        return
+
+    # Exports and event streams produce their body, and run most of their
+    # queries, after the view returned. Measure them while they do, and
+    # record the request once the server closes the response.
+    if response.is_async:
+        response.streaming_content = ameasure_chunks(response.streaming_content, metrics)
+    else:
+        response.streaming_content = measure_chunks(response.streaming_content, metrics)
+    response._resource_closers.append(
+        lambda: record_request(request, response, metrics, started)
+    )
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    """
+    Record query count, database time, the slowest query and template time
+    of each request.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            metrics, token, started = start_request(request)
+            try:
+                response = await get_response(request)
+            finally:
+                current_metrics.reset(token)
+            finish_request(request, response, metrics, started)
+            return response
+
+    else:
+
+        def middleware(request):
+            metrics, token, started = start_request(request)
+            try:
+                response = get_response(request)
+            finally:
+                current_metrics.reset(token)
+            finish_request(request, response, metrics, started)
+            return response
+
+    return middleware
@@ -0,0 +1,123 @@
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils.timezone import now
+from meal_together.models.credits import CreditBalance
+from meal_together.models.sessions import Order
+
+Pair = Tuple[int, int]
+
+
+def get_credit_contribution(order: Order) -> Optional[Tuple[int, int, Decimal]]:
+    """
+    Return (debtor_id, creditor_id, amount) for a Credit order placed by
+    someone other than the session creator, None otherwise.
+    """
+    if order.payment_method != "Credit":
+        return None
+    creditor_id = order.session.creator_id
+    if order.user_id == creditor_id or not order.total_price:
+        return None
+    return order.user_id, creditor_id, order.total_price
+
+
+def apply_credit_delta(
+    debtor_id: int, creditor_id: int, amount: Decimal, create: bool = True
+) -> None:
+    """
+    Move `amount` of debt from debtor to creditor in both directions of the
+    pair using F() updates, so concurrent orders never overwrite each other.
+    """
+    if not amount or debtor_id == creditor_id:
+        return
+
+    with transaction.atomic():
+        if create:
+            CreditBalance.objects.bulk_create(
+                [
+                    CreditBalance(user_id=debtor_id, counterparty_id=creditor_id),
+                    CreditBalance(user_id=creditor_id, counterparty_id=debtor_id),
+                ],
+                ignore_conflicts=True,
+            )
+        CreditBalance.objects.filter(
+            user_id=debtor_id, counterparty_id=creditor_id
+        ).update(balance=F("balance") + amount, updated_at=now())
+        CreditBalance.objects.filter(
+            user_id=creditor_id, counterparty_id=debtor_id
+        ).update(balance=F("balance") - amount, updated_at=now())
+
+
+def update_credit_ledger(old_contribution, new_contribution) -> None:
+    """
+    Replace an order's previous contribution to the ledger with its new one.
+    """
+    if old_contribution == new_contribution:
+        return
+    with transaction.atomic():
+        if old_contribution:
+            debtor_id, creditor_id, amount = old_contribution
+            apply_credit_delta(debtor_id, creditor_id, -amount, create=False)
+        if new_contribution:
+            apply_credit_delta(*new_contribution)
+
+
+def compute_expected_balances() -> Dict[Pair, Decimal]:
+    """
+    Recompute every pairwise balance from the Credit order history.
+    """
+    expected = {}
+    totals = (
+        Order.objects.filter(payment_method="Credit")
+        .exclude(user=F("session__creator"))
+        .values("user", "session__creator")
+        .annotate(total=Sum("total_price"))
+    )
+    for row in totals:
+        debtor_id, creditor_id = row["user"], row["session__creator"]
+        expected[(debtor_id, creditor_id)] = (
+            expected.get((debtor_id, creditor_id), 0) + row["total"]
+        )
+        expected[(creditor_id, debtor_id)] = (
+            expected.get((creditor_id, debtor_id), 0) - row["total"]
+        )
+    return expected
+
+
+def find_ledger_drift() -> List[Tuple[Pair, Decimal, Decimal]]:
+    """
+    List (pair, stored, expected) for every pair whose stored balance does
+    not match the order history.
+    """
+    expected = compute_expected_balances()
+    stored = {
+        (row["user"], row["counterparty"]): row["balance"]
+        for row in CreditBalance.objects.values("user", "counterparty", "balance")
+    }
+    drift = []
+    for pair in set(expected) | set(stored):
+        stored_balance = stored.get(pair, 0)
+        expected_balance = expected.get(pair, 0)
+        if stored_balance != expected_balance:
+            drift.append((pair, stored_balance, expected_balance))
+    return drift
+
+
+def rebuild_credit_ledger() -> int:
+    """
+    Replace the ledger with balances recomputed from the order history.
+    Returns the number of rows written.
+    """
+    expected = compute_expected_balances()
+    with transaction.atomic():
+        CreditBalance.objects.all().delete()
+        CreditBalance.objects.bulk_create(
+            [
+                CreditBalance(user_id=user_id, counterparty_id=counterparty_id, balance=balance)
+                for (user_id, counterparty_id), balance in expected.items()
+                if balance
+            ],
+            batch_size=1000,
+        )
+    return len([balance for balance in expected.values() if balance])
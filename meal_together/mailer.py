@@ -0,0 +1,160 @@
+import json
+import logging
+from smtplib import SMTPServerDisconnected
+from typing import Dict, List
+
+import redis
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+EMAIL_QUEUE_KEY = "meal_together:email_queue"
+EMAIL_FLUSH_SCHEDULED_KEY = "meal_together:email_flush_scheduled"
+
+_redis_client = None
+_connection = None
+
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _redis_client
+
+
+def get_pooled_connection():
+    """
+    Return the email connection of this worker process, opening it on first
+    use. The connection stays open between batches instead of doing a new
+    TLS handshake for every message.
+    """
+    global _connection
+    if _connection is None:
+        _connection = get_connection()
+    _connection.open()
+    return _connection
+
+
+@worker_process_shutdown.connect
+def close_pooled_connection(**kwargs):
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+def build_payload(subject: str, message: str, recipient_list: List[str]) -> Dict:
+    return {
+        "subject": subject,
+        "message": message,
+        "recipient_list": list(recipient_list),
+        "attempt": 0,
+    }
+
+
+def queue_email(subject: str, message: str, recipient_list: List[str]) -> None:
+    if recipient_list:
+        queue_emails([build_payload(subject, message, recipient_list)])
+
+
+def queue_emails(payloads: List[Dict]) -> None:
+    """
+    Queue messages for the next batch in a single round trip. The first
+    messages of a window schedule the flush, later ones just join the queue.
+    """
+    from meal_together.tasks import flush_email_queue, send_email_batch_task
+
+    payloads = [payload for payload in payloads if payload["recipient_list"]]
+    if not payloads:
+        return
+
+    window = settings.EMAIL_BATCH_WINDOW
+    if not window:
+        send_email_batch_task.delay(payloads)
+        return
+
+    client = get_redis()
+    client.rpush(EMAIL_QUEUE_KEY, *[json.dumps(payload) for payload in payloads])
+    if client.set(EMAIL_FLUSH_SCHEDULED_KEY, 1, nx=True, ex=window * 10):
+        flush_email_queue.apply_async(countdown=window)
+
+
+def pop_queued_emails(batch_size: int) -> List[Dict]:
+    raw = get_redis().lpop(EMAIL_QUEUE_KEY, batch_size) or []
+    return [json.loads(item) for item in raw]
+
+
+def _send(connection, email: EmailMessage) -> None:
+    try:
+        connection.send_messages([email])
+    except SMTPServerDisconnected:
+        # The server dropped the idle connection, reconnect once
+        connection.close()
+        connection.open()
+        connection.send_messages([email])
+
+
+def deliver_emails(payloads: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Send each payload over the pooled connection and sort them by outcome,
+    so one bad recipient does not fail the whole batch.
+    """
+    outcomes = {"sent": [], "failed": []}
+    if not payloads:
+        return outcomes
+
+    try:
+        connection = get_pooled_connection()
+    except Exception:
+        # Without a connection every message of the batch failed, send them
+        # all down the retry path rather than losing the popped payloads
+        logger.exception("Opening the email connection failed")
+        outcomes["failed"] = list(payloads)
+        return outcomes
+
+    for payload in payloads:
+        email = EmailMessage(
+            payload["subject"],
+            payload["message"],
+            settings.DEFAULT_FROM_EMAIL,
+            payload["recipient_list"],
+            connection=connection,
+        )
+        try:
+            _send(connection, email)
+        except Exception:
+            logger.exception(
+                "Sending '%s' failed (attempt %s)",
+                payload["subject"],
+                payload["attempt"] + 1,
+            )
+            outcomes["failed"].append(payload)
+        else:
+            outcomes["sent"].append(payload)
+    return outcomes
+
+
+def retry_failed_emails(failed: List[Dict]) -> int:
+    """
+    Reschedule failed payloads with exponential backoff. Returns how many
+    were given up on after EMAIL_MAX_RETRIES attempts.
+    """
+    from meal_together.tasks import send_email_batch_task
+
+    dropped = 0
+    for payload in failed:
+        payload["attempt"] += 1
+        if payload["attempt"] > settings.EMAIL_MAX_RETRIES:
+            logger.error(
+                "Giving up on '%s' to %s after %s attempts",
+                payload["subject"],
+                payload["recipient_list"],
+                payload["attempt"],
+            )
+            dropped += 1
+            continue
+        countdown = settings.EMAIL_RETRY_BACKOFF * 2 ** (payload["attempt"] - 1)
+        send_email_batch_task.apply_async(args=[[payload]], countdown=countdown)
+    return dropped
@@ -0,0 +1,256 @@
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from meal_together.management.utils import percentile
+from meal_together.models.credits import CreditBalance
+from meal_together.models.sessions import MealSession, Order, OrderItem
+
+User = get_user_model()
+
+DEFAULT_BASELINE = settings.BASE_DIR / "benchmarks" / "baseline.json"
+
+
+def formset_management(prefix, total, initial):
+    return {
+        f"{prefix}-TOTAL_FORMS": str(total),
+        f"{prefix}-INITIAL_FORMS": str(initial),
+        f"{prefix}-MIN_NUM_FORMS": "0",
+        f"{prefix}-MAX_NUM_FORMS": "1000",
+    }
+
+
+# Orders are created and edited with this many lines, whatever the dataset,
+# so the query counts of the writes do not depend on the seed
+ORDER_LINES = 3
+
+
+class Scenario:
+    """
+    One request to benchmark. Writes run in a transaction that is rolled
+    back, so the dataset stays the same between iterations and runs. Their
+    `prepare` callable sets up the rows the request needs inside that
+    transaction and returns the POST data.
+    """
+
+    def __init__(self, name, user, method, url, prepare=None):
+        self.name = name
+        self.user = user
+        self.method = method
+        self.url = url
+        self.prepare = prepare
+
+    def run(self, client):
+        if self.prepare is None:
+            return self.request(client, {})
+        with transaction.atomic():
+            response = self.request(client, self.prepare())
+            transaction.set_rollback(True)
+        return response
+
+    def request(self, client, data):
+        response = getattr(client, self.method)(self.url, data)
+        if response.status_code not in (200, 302):
+            raise CommandError(f"{self.name}: {self.url} returned {response.status_code}")
+        return response
+
+
+def build_scenarios():
+    """
+    Pick the busiest open session of the dataset and its people, see
+    seed_demo_data.
+    """
+    session = (
+        MealSession.objects.active()
+        .filter(orders__isnull=False)
+        .select_related("creator", "restaurant")
+        .order_by("-order_count", "pk")
+        .first()
+    )
+    if session is None:
+        raise CommandError("No open session with orders, run seed_demo_data first.")
+    creator = session.creator
+    order = (
+        Order.objects.filter(session=session)
+        .exclude(user=creator)
+        .select_related("user")
+        .order_by("pk")
+        .first()
+    )
+    if order is None:
+        raise CommandError(f"Session {session.id} has no orders besides the creator's.")
+    menu_items = list(session.restaurant.menu_items.order_by("pk")[:ORDER_LINES])
+    if len(menu_items) < ORDER_LINES:
+        raise CommandError(
+            f"The menu of restaurant {session.restaurant_id} has fewer than "
+            f"{ORDER_LINES} items."
+        )
+    debtor = (
+        CreditBalance.objects.values("user")
+        .annotate(balances=Count("pk"))
+        .order_by("-balances", "user")
+        .first()
+    )
+    balance_user = User.objects.get(pk=debtor["user"]) if debtor else creator
+
+    def prepare_create():
+        # Make room for the new order
+        Order.objects.filter(pk=order.pk).delete()
+        data = {
+            "payment_method": "Credit",
+            **formset_management("orderitem_set", ORDER_LINES, 0),
+        }
+        for index, menu_item in enumerate(menu_items):
+            data[f"orderitem_set-{index}-menu_item"] = menu_item.pk
+            data[f"orderitem_set-{index}-quantity"] = "2"
+            data[f"orderitem_set-{index}-note"] = ""
+        return data
+
+    def prepare_edit():
+        # Give the order exactly ORDER_LINES lines to edit, paid in cash, so
+        # the edit always moves it onto the credit ledger
+        Order.objects.filter(pk=order.pk).update(payment_method="Cash")
+        order.orderitem_set.all().delete()
+        items = OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=menu_item, quantity=1, unit_price=menu_item.price)
+            for menu_item in menu_items
+        )
+        data = {
+            "payment_method": "Credit",
+            **formset_management("orderitem_set", len(items), len(items)),
+        }
+        for index, item in enumerate(items):
+            data[f"orderitem_set-{index}-id"] = item.pk
+            data[f"orderitem_set-{index}-order"] = order.pk
+            data[f"orderitem_set-{index}-menu_item"] = item.menu_item_id
+            data[f"orderitem_set-{index}-quantity"] = "2"
+            data[f"orderitem_set-{index}-note"] = "benchmark"
+        return data
+
+    order_url = f"/sessions/{session.id}"
+    return [
+        Scenario("session_list", creator, "get", "/sessions/"),
+        Scenario("session_detail", creator, "get", f"{order_url}/"),
+        Scenario("session_summary", creator, "get", f"{order_url}/summary/"),
+        Scenario(
+            "create_order",
+            creator,
+            "post",
+            f"{order_url}/create_order/{order.user_id}/",
+            prepare_create,
+        ),
+        Scenario(
+            "edit_order",
+            creator,
+            "post",
+            f"{order_url}/edit_order/{order.user_id}/",
+            prepare_edit,
+        ),
+        Scenario("credit_balance_view", balance_user, "get", "/credit_balance/"),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the ordering flow through the test client against the current "
+        "database and report query counts, p50/p95 latency and peak memory. "
+        "Results can be stored as a baseline and later checked against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--warmup", type=int, default=3, help="Untimed requests per scenario."
+        )
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            "--save-baseline", action="store_true", help="Write the results to --baseline."
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Fail if a scenario runs more queries than in --baseline. Latency "
+                "and memory depend on the machine and are only reported."
+            ),
+        )
+
+    def measure(self, scenario, iterations, warmup):
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(scenario.user)
+        for _ in range(warmup):
+            scenario.run(client)
+
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = scenario.run(client)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        # A separate traced run, tracemalloc would skew the timings
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            scenario.run(client)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "queries": response.request_metrics["queries"],
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "peak_memory_kb": round(peak_memory / 1024, 1),
+        }
+
+    def find_regressions(self, results, baseline):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is not None and result["queries"] > expected["queries"]:
+                regressions.append(
+                    f"{name}: {result['queries']} queries, baseline {expected['queries']}"
+                )
+        return regressions
+
+    def handle(self, *args, **options):
+        # The per-request metric lines would drown the report
+        logging.getLogger("meal_together.instrumentation").setLevel(logging.ERROR)
+
+        baseline_path = Path(options["baseline"])
+        results = {}
+        for scenario in build_scenarios():
+            results[scenario.name] = result = self.measure(
+                scenario, options["iterations"], options["warmup"]
+            )
+            self.stdout.write(
+                f"{scenario.name:>20}: {result['queries']:>3} queries, "
+                f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+                f"peak {result['peak_memory_kb']:.0f} KiB"
+            )
+
+        if options["save_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}."))
+
+        if options["check"]:
+            if not baseline_path.exists():
+                raise CommandError(f"No baseline at {baseline_path}, run with --save-baseline.")
+            regressions = self.find_regressions(
+                results, json.loads(baseline_path.read_text())
+            )
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmark regressions.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,110 @@
+import statistics
+import threading
+import time
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+from meal_together.management.utils import percentile
+
+# Pools are kept per alias for the whole process, use one that the
+# application never does
+BENCHMARK_ALIAS = "connection_benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request database latency with a new connection per "
+        "request, persistent connections and the psycopg connection pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Simulated requests per mode."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=10, help="Concurrent request threads."
+        )
+        parser.add_argument(
+            "--queries", type=int, default=5, help="Queries per simulated request."
+        )
+
+    def get_modes(self, concurrency):
+        base = deepcopy(settings.DATABASES[DEFAULT_DB_ALIAS])
+        base["OPTIONS"] = {
+            key: value for key, value in base.get("OPTIONS", {}).items() if key != "pool"
+        }
+        base["CONN_MAX_AGE"] = 0
+        modes = {"new connection": base}
+
+        persistent = deepcopy(base)
+        persistent["CONN_MAX_AGE"] = 600
+        persistent["CONN_HEALTH_CHECKS"] = True
+        modes["persistent"] = persistent
+
+        pooled = deepcopy(base)
+        pooled["OPTIONS"]["pool"] = {
+            "min_size": 1,
+            "max_size": concurrency,
+            "timeout": 10,
+        }
+        modes["pool"] = pooled
+        return modes
+
+    def run_mode(self, settings_dict, requests, concurrency, queries):
+        # A handler always needs a default database, it is never connected
+        handler = ConnectionHandler(
+            {DEFAULT_DB_ALIAS: settings_dict, BENCHMARK_ALIAS: settings_dict}
+        )
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(count):
+            connection = handler[BENCHMARK_ALIAS]
+            for _ in range(count):
+                started = time.perf_counter()
+                # What request_started and request_finished do
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    for _ in range(queries):
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+            connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(requests // concurrency,))
+            for _ in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        connection = handler[BENCHMARK_ALIAS]
+        if settings_dict["OPTIONS"].get("pool"):
+            connection.close_pool()
+        return latencies, elapsed
+
+    def handle(self, *args, **options):
+        if settings.DATABASES[DEFAULT_DB_ALIAS]["ENGINE"] != "django.db.backends.postgresql":
+            raise CommandError("The benchmark needs the PostgreSQL database backend.")
+
+        concurrency = options["concurrency"]
+        for name, settings_dict in self.get_modes(concurrency).items():
+            latencies, elapsed = self.run_mode(
+                settings_dict, options["requests"], concurrency, options["queries"]
+            )
+            latencies = [latency * 1000 for latency in latencies]
+            self.stdout.write(
+                f"{name:>15}: {len(latencies) / elapsed:.0f} req/s, "
+                f"mean {statistics.mean(latencies):.2f} ms, "
+                f"p50 {statistics.median(latencies):.2f} ms, "
+                f"p95 {percentile(latencies, 0.95):.2f} ms"
+            )
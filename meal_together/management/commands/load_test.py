@@ -0,0 +1,95 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.shortcuts import resolve_url
+from meal_together.management.utils import percentile
+
+DEFAULT_PATHS = ["/sessions/", "/credit_balance/"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit a running server with concurrent logged-in requests and report "
+        "throughput and latency percentiles per path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--username", required=True, help="User the requests are made as."
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help=f"Path to request, can be repeated. Defaults to {', '.join(DEFAULT_PATHS)}.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=20, help="Simulated concurrent users."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per path."
+        )
+
+    def login_cookie(self, username):
+        """
+        Open a session for the user directly in the session store, the way
+        the test client logs in, so no password is needed.
+        """
+        user = get_user_model().objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f"User {username!r} does not exist.")
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+    def fetch(self, url, cookie):
+        request = Request(url, headers={"Cookie": cookie})
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=30) as response:
+                response.read()
+                # A lost session shows up as a redirect to the login page
+                ok = urlparse(response.url).path != resolve_url(settings.LOGIN_URL)
+        except (HTTPError, URLError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    def handle(self, *args, **options):
+        cookie = self.login_cookie(options["username"])
+        base_url = options["base_url"].rstrip("/")
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            for path in options["paths"] or DEFAULT_PATHS:
+                url = base_url + path
+                started = time.perf_counter()
+                results = list(
+                    pool.map(
+                        lambda _: self.fetch(url, cookie), range(options["requests"])
+                    )
+                )
+                elapsed = time.perf_counter() - started
+
+                latencies = [latency * 1000 for latency, ok in results if ok]
+                errors = len(results) - len(latencies)
+                if not latencies:
+                    self.stdout.write(self.style.ERROR(f"{path}: all {errors} requests failed"))
+                    continue
+                self.stdout.write(
+                    f"{path}: {len(results) / elapsed:.1f} req/s, "
+                    f"p50 {statistics.median(latencies):.0f} ms, "
+                    f"p95 {percentile(latencies, 0.95):.0f} ms, "
+                    f"p99 {percentile(latencies, 0.99):.0f} ms, "
+                    f"errors {errors}"
+                )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from meal_together.ledger import find_ledger_drift, rebuild_credit_ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the credit ledger from Order history, or check it for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report pairs whose stored balance differs from Order history.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = find_ledger_drift()
+            for (user_id, counterparty_id), stored, expected in drift:
+                self.stdout.write(
+                    f"user {user_id} -> {counterparty_id}: stored {stored}, expected {expected}"
+                )
+            if drift:
+                raise CommandError(f"Credit ledger drift found in {len(drift)} balances.")
+            self.stdout.write(self.style.SUCCESS("Credit ledger is consistent."))
+            return
+
+        written = rebuild_credit_ledger()
+        self.stdout.write(self.style.SUCCESS(f"Credit ledger rebuilt with {written} balances."))
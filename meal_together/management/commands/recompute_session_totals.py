@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from meal_together.counters import find_session_drift, recompute_session_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute session totals and counters from orders, or check them for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report sessions whose stored counters differ from their orders.",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_session_drift()
+        for session in drift:
+            self.stdout.write(
+                f"session {session.pk}: total {session.total_spent} (expected {session.expected_total_spent}), "
+                f"orders {session.order_count} (expected {session.expected_order_count}), "
+                f"participants {session.participant_count} (expected {session.expected_participant_count})"
+            )
+
+        if options["check"]:
+            if drift:
+                raise CommandError(f"Session totals drift found in {len(drift)} sessions.")
+            self.stdout.write(self.style.SUCCESS("Session totals are consistent."))
+            return
+
+        updated = recompute_session_totals()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {updated} sessions."))
@@ -0,0 +1,219 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+from meal_together.counters import recompute_session_totals
+from meal_together.directory import invalidate_directory
+from meal_together.ledger import rebuild_credit_ledger
+from meal_together.menus import invalidate_menu
+from meal_together.models.restaurants import MenuItem, Restaurant, Tag
+from meal_together.models.sessions import MealSession, Order, OrderItem
+
+User = get_user_model()
+
+ITEM_TYPES = ["Starter", "Soup", "Main", "Pizza", "Pasta", "Salad", "Dessert", "Drink"]
+TAGS = ["Polish", "Italian", "Asian", "Vegan", "Burgers", "Sushi", "Kebab", "Healthy"]
+FIRST_NAMES = ["Anna", "Piotr", "Kasia", "Tomek", "Ola", "Marek", "Ewa", "Jan", "Zofia", "Adam"]
+LAST_NAMES = ["Nowak", "Kowalski", "Wisniewska", "Wojcik", "Kaminski", "Lewandowska", "Zielinski"]
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a realistic dataset of users, groups, restaurants with large menus, "
+        "sessions and orders for load tests and benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--groups", type=int, default=50)
+        parser.add_argument("--restaurants", type=int, default=50)
+        parser.add_argument("--menu-size", type=int, default=150, help="Items per restaurant.")
+        parser.add_argument("--sessions", type=int, default=500)
+        parser.add_argument(
+            "--participants", type=int, default=20, help="Participants per session."
+        )
+        parser.add_argument(
+            "--prefix",
+            default="demo",
+            help="Prefix of usernames and emails, so several datasets can coexist.",
+        )
+        parser.add_argument("--password", default="demo", help="Password of every user.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Users prefixed {prefix!r} already exist, pick another --prefix.")
+        if options["participants"] > options["users"]:
+            raise CommandError("--participants cannot exceed --users.")
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            users = self.create_users(rng, prefix, options["users"], options["password"])
+            self.create_groups(rng, prefix, users, options["groups"])
+            restaurants = self.create_restaurants(
+                rng, prefix, users, options["restaurants"], options["menu_size"]
+            )
+            sessions = self.create_sessions(
+                rng, prefix, users, restaurants, options["sessions"], options["participants"]
+            )
+            order_count = self.create_orders(rng, sessions)
+
+            # Rows were bulk inserted, so no signal kept these up to date
+            rebuild_credit_ledger()
+            recompute_session_totals([session.id for session in sessions])
+
+        for restaurant in restaurants:
+            invalidate_menu(restaurant.id)
+        invalidate_directory()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(users)} users, {options['groups']} groups, "
+                f"{len(restaurants)} restaurants, {len(sessions)} sessions and "
+                f"{order_count} orders. Log in as {prefix}-user-0@example.com."
+            )
+        )
+
+    def create_users(self, rng, prefix, count, password):
+        # Hashing is deliberately slow, every user shares one hash
+        password_hash = make_password(password)
+        return User.objects.bulk_create(
+            [
+                User(
+                    username=f"{prefix}-user-{i}",
+                    email=f"{prefix}-user-{i}@example.com",
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    password=password_hash,
+                )
+                for i in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def create_groups(self, rng, prefix, users, count):
+        groups = Group.objects.bulk_create(
+            [Group(name=f"{prefix}-team-{i}") for i in range(count)]
+        )
+        if not groups:
+            return
+        Membership = User.groups.through
+        Membership.objects.bulk_create(
+            [Membership(customuser_id=user.id, group_id=rng.choice(groups).id) for user in users],
+            batch_size=BATCH_SIZE,
+        )
+
+    def create_restaurants(self, rng, prefix, users, count, menu_size):
+        tags = [Tag.objects.get_or_create(name=name)[0] for name in TAGS]
+        restaurants = Restaurant.objects.bulk_create(
+            [
+                Restaurant(
+                    name=f"{prefix.title()} Restaurant {i}",
+                    address=f"Main Street {i}",
+                    phone_number=f"{500000000 + i}",
+                    owner=rng.choice(users),
+                )
+                for i in range(count)
+            ]
+        )
+        Tagging = Restaurant.tags.through
+        Tagging.objects.bulk_create(
+            [
+                Tagging(restaurant_id=restaurant.id, tag_id=tag.id)
+                for restaurant in restaurants
+                for tag in rng.sample(tags, 2)
+            ]
+        )
+        MenuItem.objects.bulk_create(
+            [
+                MenuItem(
+                    restaurant=restaurant,
+                    item_type=ITEM_TYPES[i % len(ITEM_TYPES)],
+                    name=f"{ITEM_TYPES[i % len(ITEM_TYPES)]} {i}",
+                    price=Decimal(rng.randrange(500, 6000)) / 100,
+                )
+                for restaurant in restaurants
+                for i in range(menu_size)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return restaurants
+
+    def create_sessions(self, rng, prefix, users, restaurants, count, participants):
+        current_time = now()
+        sessions = []
+        for i in range(count):
+            # A quarter of the sessions are still open for orders
+            if i % 4 == 0:
+                deadline = current_time + timedelta(hours=rng.randint(1, 48))
+            else:
+                deadline = current_time - timedelta(days=rng.randint(1, 365))
+            sessions.append(
+                MealSession(
+                    name=f"{prefix.title()} Lunch {i}",
+                    restaurant=rng.choice(restaurants),
+                    creator=rng.choice(users),
+                    order_deadline=deadline,
+                    delivery_time=deadline + timedelta(hours=1),
+                    # Past sessions were notified long ago
+                    email_sent=deadline < current_time,
+                )
+            )
+        sessions = MealSession.objects.bulk_create(sessions)
+
+        Participation = MealSession.participants.through
+        rows = []
+        for session in sessions:
+            members = {session.creator} | set(rng.sample(users, participants - 1))
+            session.members = list(members)
+            rows.extend(
+                Participation(mealsession_id=session.id, customuser_id=user.id)
+                for user in members
+            )
+        Participation.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        return sessions
+
+    def create_orders(self, rng, sessions):
+        menus = {}
+        for item in MenuItem.objects.filter(
+            restaurant__in={session.restaurant_id for session in sessions}
+        ).only("id", "restaurant_id", "price"):
+            menus.setdefault(item.restaurant_id, []).append(item)
+
+        orders, lines = [], []
+        for session in sessions:
+            for user in session.members:
+                # Not everybody invited orders
+                if rng.random() > 0.8:
+                    continue
+                picked = [
+                    (item, rng.randint(1, 3))
+                    for item in rng.sample(menus[session.restaurant_id], rng.randint(1, 4))
+                ]
+                order = Order(
+                    session=session,
+                    user=user,
+                    payment_method=rng.choice(Order.PAYMENT_METHOD_CHOICES)[0],
+                    total_price=sum(item.price * quantity for item, quantity in picked),
+                )
+                orders.append(order)
+                lines.append(picked)
+
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=order, menu_item=item, quantity=quantity, unit_price=item.price)
+                for order, picked in zip(orders, lines)
+                for item, quantity in picked
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return len(orders)
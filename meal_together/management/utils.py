@@ -0,0 +1,4 @@
+def percentile(samples, fraction):
+    """Nearest-rank percentile, e.g. fraction=0.95 for p95."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from meal_together.exports import Echo
+from meal_together.forms.restaurants import MenuItemForm
+from meal_together.menus import invalidate_menu
+from meal_together.models.restaurants import MenuItem, Restaurant
+
+MENU_FILE_FORMATS = {
+    "csv": "text/csv",
+    "json": "application/json",
+}
+MENU_FILE_FIELDS = ["item_type", "name", "price", "currency"]
+DEFAULT_CURRENCY = MenuItem._meta.get_field("currency").default
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+Row = Tuple[int, Dict]
+
+
+class MenuImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors: List[Tuple[int, str]] = []
+
+
+def read_csv_rows(file) -> Iterator[Row]:
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    try:
+        missing = set(MENU_FILE_FIELDS[:3]) - set(reader.fieldnames or [])
+        if missing:
+            raise ValidationError(
+                f"The header row lacks the columns: {', '.join(sorted(missing))}."
+            )
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise ValidationError("The file is not UTF-8 encoded.")
+    except csv.Error as error:
+        raise ValidationError(f"Line {reader.line_num}: {error}")
+
+
+def read_json_rows(file) -> Iterator[Row]:
+    # The standard library cannot parse JSON incrementally, menus are small
+    # enough to be loaded at once
+    try:
+        rows = json.load(file)
+    except (UnicodeDecodeError, ValueError) as error:
+        raise ValidationError(f"The file is not valid JSON: {error}")
+    if not isinstance(rows, list):
+        raise ValidationError("The file must contain a list of menu items.")
+    for number, row in enumerate(rows, start=1):
+        yield number, row if isinstance(row, dict) else {}
+
+
+def read_menu_file(file, file_format: str) -> Iterator[Row]:
+    """
+    Yield (line or item number, row) pairs of an uploaded menu file. Raises
+    ValidationError when the file as a whole cannot be read.
+    """
+    if file_format == "csv":
+        return read_csv_rows(file)
+    return read_json_rows(file)
+
+
+def clean_menu_row(row: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Validate a row with the fields of MenuItemForm. They are stateless, so
+    they are shared by all rows instead of building a form per row, which
+    costs more than the writes.
+    """
+    data, errors = {}, []
+    for name, field in MenuItemForm.base_fields.items():
+        try:
+            data[name] = field.clean(row.get(name))
+        except ValidationError as error:
+            errors.append(f"{name}: {' '.join(error.messages)}")
+    return data, errors
+
+
+def import_menu(restaurant: Restaurant, rows: Iterable[Row]) -> MenuImportResult:
+    """
+    Create or update menu items keyed by (item_type, name), validating each
+    row like MenuItemForm does. Writes are batched and all happen in a single
+    transaction, which is rolled back if any row is invalid.
+    """
+    result = MenuImportResult()
+    existing = {}
+    seen = set()
+    to_create, to_update = [], []
+
+    def flush():
+        # Rows after an error are only validated, nothing would be kept
+        if not result.errors:
+            MenuItem.objects.bulk_create(to_create)
+            MenuItem.objects.bulk_update(to_update, ["price", "currency"])
+        to_create.clear()
+        to_update.clear()
+
+    with transaction.atomic():
+        # Nothing in the database keeps (restaurant, item_type, name) unique.
+        # Locking the restaurant runs imports of one restaurant one at a
+        # time, and on PostgreSQL also holds back menu items added meanwhile,
+        # as their foreign key check needs a lock this one conflicts with.
+        Restaurant.objects.select_for_update().get(pk=restaurant.pk)
+        # With duplicate items already in the menu the oldest one is updated
+        for item in MenuItem.objects.filter(restaurant=restaurant).order_by("-pk"):
+            existing[(item.item_type, item.name)] = item
+
+        for number, row in rows:
+            if not row.get("currency"):
+                row = {**row, "currency": DEFAULT_CURRENCY}
+            data, errors = clean_menu_row(row)
+            if errors:
+                result.errors.append((number, "; ".join(errors)))
+                continue
+
+            key = (data["item_type"], data["name"])
+            if key in seen:
+                result.errors.append((number, f"Duplicate of an earlier {key[0]} {key[1]!r}."))
+                continue
+            seen.add(key)
+
+            item = existing.get(key)
+            if item is None:
+                to_create.append(MenuItem(restaurant=restaurant, **data))
+                result.created += 1
+            elif (item.price, item.currency) != (data["price"], data["currency"]):
+                item.price = data["price"]
+                item.currency = data["currency"]
+                to_update.append(item)
+                result.updated += 1
+            else:
+                result.unchanged += 1
+
+            if len(to_create) + len(to_update) >= IMPORT_CHUNK_SIZE:
+                flush()
+        flush()
+
+        if result.errors:
+            transaction.set_rollback(True)
+        elif result.created or result.updated:
+            # Bulk writes send no post_save, so the menu cache is not
+            # invalidated by the signal
+            transaction.on_commit(lambda: invalidate_menu(restaurant.id))
+    return result
+
+
+def format_csv_row(writer, item: Dict) -> str:
+    return writer.writerow([item[name] for name in MENU_FILE_FIELDS])
+
+
+def format_json_row(writer, item: Dict) -> str:
+    # Keep prices exact, the import accepts strings and numbers alike
+    return json.dumps({**item, "price": str(item["price"])})
+
+
+async def export_menu(restaurant_id: int, file_format: str) -> AsyncIterator[str]:
+    """
+    Stream the restaurant menu in the format import_menu reads, one chunk of
+    items at a time.
+    """
+    # values() rather than values_list(), whose aiterator() opens the cursor
+    # in the event loop
+    items = (
+        MenuItem.objects.filter(restaurant_id=restaurant_id)
+        .order_by("item_type", "name", "pk")
+        .values(*MENU_FILE_FIELDS)
+    )
+    writer = csv.writer(Echo())
+    if file_format == "csv":
+        yield writer.writerow(MENU_FILE_FIELDS)
+        format_row = format_csv_row
+    else:
+        yield "["
+        format_row = format_json_row
+
+    chunk = []
+    first = True
+    async for item in items.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        line = format_row(writer, item)
+        if file_format == "json":
+            line = ("\n" if first else ",\n") + line
+        first = False
+        chunk.append(line)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+    if file_format == "json":
+        yield "\n]\n"
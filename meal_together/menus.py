@@ -0,0 +1,52 @@
+from itertools import groupby
+from typing import Any, Dict
+from django.core.cache import cache
+from meal_together.caching import bump_cache_version, get_cache_version
+from meal_together.models.restaurants import MenuItem
+from meal_together.search import invalidate_menu_search
+
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(restaurant_id: int) -> str:
+    return f"menu_version:{restaurant_id}"
+
+
+def get_menu_version(restaurant_id: int) -> str:
+    return get_cache_version(_version_key(restaurant_id))
+
+
+def invalidate_menu(restaurant_id: int) -> None:
+    """Move the restaurant's menu and all search results to a new version."""
+    bump_cache_version(_version_key(restaurant_id))
+    invalidate_menu_search()
+
+
+def build_menu(restaurant_id: int) -> Dict[str, Any]:
+    items = list(
+        MenuItem.objects.filter(restaurant_id=restaurant_id).order_by("item_type", "pk")
+    )
+
+    grouped_menu = {}
+    for item_type, type_items in groupby(items, lambda x: x.item_type):
+        grouped_menu[item_type] = list(type_items)
+
+    return {
+        "items": items,
+        "grouped": grouped_menu,
+        "prices": {item.pk: item.price for item in items},
+        "choices": [("", "---------")] + [(item.pk, str(item)) for item in items],
+    }
+
+
+def get_cached_menu(restaurant_id: int) -> Dict[str, Any]:
+    """
+    The restaurant menu grouped by item type, with an id -> price map and the
+    choice list used by order forms, served from the cache when possible.
+    """
+    key = f"menu:{restaurant_id}:{get_menu_version(restaurant_id)}"
+    menu = cache.get(key)
+    if menu is None:
+        menu = build_menu(restaurant_id)
+        cache.set(key, menu, MENU_CACHE_TIMEOUT)
+    return menu
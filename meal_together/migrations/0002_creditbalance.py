@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_credit_balances(apps, schema_editor):
+    Order = apps.get_model('meal_together', 'Order')
+    CreditBalance = apps.get_model('meal_together', 'CreditBalance')
+
+    balances = {}
+    totals = (
+        Order.objects.filter(payment_method='Credit')
+        .exclude(user=models.F('session__creator'))
+        .values('user', 'session__creator')
+        .annotate(total=models.Sum('total_price'))
+    )
+    for row in totals:
+        debtor_id, creditor_id = row['user'], row['session__creator']
+        balances[(debtor_id, creditor_id)] = balances.get((debtor_id, creditor_id), 0) + row['total']
+        balances[(creditor_id, debtor_id)] = balances.get((creditor_id, debtor_id), 0) - row['total']
+
+    CreditBalance.objects.bulk_create(
+        [
+            CreditBalance(user_id=user_id, counterparty_id=counterparty_id, balance=balance)
+            for (user_id, counterparty_id), balance in balances.items()
+            if balance
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('counterparty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'counterparty'), name='unique_credit_balance_pair')],
+            },
+        ),
+        migrations.RunPython(populate_credit_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+def merge_duplicate_orders(apps, schema_editor):
+    """
+    Fold every extra order of a user in a session into their first one,
+    moving its items and adding up the totals, so the unique constraint
+    below can be added. The credit ledger is adjusted only when the merged
+    orders were paid differently.
+    """
+    Order = apps.get_model('meal_together', 'Order')
+    OrderItem = apps.get_model('meal_together', 'OrderItem')
+    CreditBalance = apps.get_model('meal_together', 'CreditBalance')
+
+    duplicates = (
+        Order.objects.values('session', 'user')
+        .annotate(count=models.Count('pk'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        orders = list(
+            Order.objects.filter(session=row['session'], user=row['user'])
+            .select_related('session')
+            .order_by('pk')
+        )
+        kept, extra = orders[0], orders[1:]
+        creditor_id = kept.session.creator_id
+
+        def credit(order):
+            if order.payment_method == 'Credit' and order.user_id != creditor_id:
+                return order.total_price
+            return 0
+
+        credit_before = sum(credit(order) for order in orders)
+        OrderItem.objects.filter(order__in=extra).update(order=kept)
+        kept.total_price = sum(order.total_price for order in orders)
+        kept.save(update_fields=['total_price'])
+        Order.objects.filter(pk__in=[order.pk for order in extra]).delete()
+
+        delta = credit(kept) - credit_before
+        if delta:
+            for user_id, counterparty_id, amount in [
+                (kept.user_id, creditor_id, delta),
+                (creditor_id, kept.user_id, -delta),
+            ]:
+                balance, _ = CreditBalance.objects.get_or_create(
+                    user_id=user_id, counterparty_id=counterparty_id
+                )
+                balance.balance += amount
+                balance.save(update_fields=['balance'])
+
+    if duplicates and schema_editor.connection.vendor == 'postgresql':
+        # Check the deferred foreign keys of the moved items now, PostgreSQL
+        # cannot alter a table with pending trigger events
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0002_creditbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mealsession',
+            index=models.Index(condition=models.Q(('email_sent', False)), fields=['order_deadline'], name='session_deadline_unsent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['restaurant', 'item_type'], name='menuitem_restaurant_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('payment_method', 'Credit')), fields=['user'], name='order_credit_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('payment_method', 'Credit')), fields=['session'], name='order_credit_session_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('session', 'user'), name='unique_order_per_session_user'),
+        ),
+    ]
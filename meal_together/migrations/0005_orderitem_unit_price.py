@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def snapshot_unit_prices(apps, schema_editor):
+    OrderItem = apps.get_model('meal_together', 'OrderItem')
+    MenuItem = apps.get_model('meal_together', 'MenuItem')
+    OrderItem.objects.update(
+        unit_price=models.Subquery(
+            MenuItem.objects.filter(pk=models.OuterRef('menu_item')).values('price')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0004_emailevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(snapshot_unit_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_session_counters(apps, schema_editor):
+    MealSession = apps.get_model('meal_together', 'MealSession')
+    Order = apps.get_model('meal_together', 'Order')
+    Participant = MealSession.participants.through
+
+    orders = Order.objects.filter(session=models.OuterRef('pk')).order_by().values('session')
+    participants = (
+        Participant.objects.filter(mealsession=models.OuterRef('pk'))
+        .order_by()
+        .values('mealsession')
+    )
+    MealSession.objects.update(
+        total_spent=Coalesce(
+            models.Subquery(
+                orders.annotate(total=models.Sum('total_price')).values('total'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        order_count=Coalesce(
+            models.Subquery(
+                orders.annotate(count=models.Count('pk')).values('count'),
+                output_field=models.IntegerField(),
+            ),
+            models.Value(0),
+        ),
+        participant_count=Coalesce(
+            models.Subquery(
+                participants.annotate(count=models.Count('pk')).values('count'),
+                output_field=models.IntegerField(),
+            ),
+            models.Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0005_orderitem_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealsession',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mealsession',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mealsession',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(populate_session_counters, migrations.RunPython.noop),
+    ]
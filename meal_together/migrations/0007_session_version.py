@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0006_session_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditbalance',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='mealsession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='mealsession',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:10
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# Built from the same expression directory.search_restaurants filters on,
+# so PostgreSQL can use it. Other databases search without an index.
+SEARCH_INDEX = GinIndex(
+    SearchVector('name', 'address', config='simple'),
+    name='restaurant_search_idx',
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('meal_together', 'Restaurant'), SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('meal_together', 'Restaurant'), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0007_session_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['name'], name='restaurant_name_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# Built from the same weighted expression search.search_menu_items filters
+# on, so PostgreSQL can use it and keeps it current on every write. Other
+# databases search without an index.
+SEARCH_INDEX = GinIndex(
+    SearchVector('name', weight='A', config='simple')
+    + SearchVector('item_type', weight='B', config='simple'),
+    name='menuitem_search_idx',
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('meal_together', 'MenuItem'), SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('meal_together', 'MenuItem'), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0008_restaurant_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
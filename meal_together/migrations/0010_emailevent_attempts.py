@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_together', '0009_menuitem_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailevent',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emailevent',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
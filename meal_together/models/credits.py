@@ -0,0 +1,26 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class CreditBalance(models.Model):
+    """
+    Running credit balance of `user` towards `counterparty`.
+
+    A positive balance means the user owes the counterparty, a negative one
+    that the counterparty owes the user. Every pair is stored in both
+    directions, so a user's balances are a single indexed read.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_balances')
+    counterparty = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'counterparty'], name='unique_credit_balance_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> {self.counterparty}: {self.balance}"
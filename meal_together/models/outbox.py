@@ -0,0 +1,38 @@
+from django.db import models
+from meal_together.models.sessions import MealSession
+
+
+class EmailEvent(models.Model):
+    """
+    Outbox row written in the same transaction as the change it announces.
+    Recipients are expanded and messages rendered later by a worker.
+    """
+    INVITATION = 'invitation'
+    SESSION_UPDATE = 'session_update'
+    ORDER_UPDATE = 'order_update'
+    KIND_CHOICES = [
+        (INVITATION, 'Invitation'),
+        (SESSION_UPDATE, 'Session update'),
+        (ORDER_UPDATE, 'Order update'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    session = models.ForeignKey(MealSession, on_delete=models.CASCADE, related_name='email_events')
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Failed dispatches, the sweep gives up on an event after
+    # outbox.MAX_EVENT_ATTEMPTS of them
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(processed_at__isnull=True),
+                name='emailevent_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.session_id}"
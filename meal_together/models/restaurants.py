@@ -17,6 +17,12 @@ class Restaurant(models.Model):
     tags = models.ManyToManyField(Tag, related_name='restaurants')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_restaurants')
 
+    class Meta:
+        indexes = [
+            # The directory is ordered by name
+            models.Index(fields=['name'], name='restaurant_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -29,5 +35,10 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2)
     currency = models.CharField(max_length=10, default='PLN')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'item_type'], name='menuitem_restaurant_type_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.item_type}) - {self.price} {self.currency}"
@@ -1,10 +1,44 @@
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from meal_together.models.restaurants import Restaurant, MenuItem
 from django.utils.timezone import now
 
 User = get_user_model()
 
+
+class MealSessionQuerySet(models.QuerySet):
+    def for_participant(self, user):
+        return self.filter(participants=user).select_related("creator", "restaurant")
+
+    def active(self):
+        return self.filter(order_deadline__gte=now()).order_by("order_deadline")
+
+    def past(self):
+        return self.filter(order_deadline__lt=now()).order_by("-order_deadline")
+
+    def with_user_spend(self, user):
+        """
+        Annotate each session with the user's total spend, computed in the
+        same SQL query as the sessions themselves.
+        """
+        user_orders = Order.objects.filter(session=OuterRef("pk"), user=user)
+        user_spend = (
+            user_orders.order_by()
+            .values("session")
+            .annotate(total=Sum("total_price"))
+            .values("total")
+        )
+        return self.annotate(
+            user_expense=Coalesce(
+                Subquery(user_spend, output_field=DecimalField()),
+                Value(0),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+
+
 class MealSession(models.Model):
     name = models.CharField(max_length=255)
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='sessions')
@@ -14,14 +48,29 @@ class MealSession(models.Model):
     delivery_time = models.DateTimeField()
     order_deadline = models.DateTimeField()
     email_sent = models.BooleanField(default=False)
+    # Maintained by meal_together.counters, repaired by recompute_session_totals
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    participant_count = models.PositiveIntegerField(default=0)
+    # Bumped on every change to the session, its orders or participants,
+    # used for ETag/Last-Modified of the JSON API
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MealSessionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['order_deadline'],
+                condition=models.Q(email_sent=False),
+                name='session_deadline_unsent_idx',
+            ),
+        ]
 
     def is_active(self):
         return now() <= self.order_deadline
 
-    def total_spent_by_user(self, user):
-        return sum(order.total_price for order in self.orders.filter(user=user))
-    
-
     def __str__(self):
         return self.name
 
@@ -42,18 +91,63 @@ class Order(models.Model):
     )
     items = models.ManyToManyField('MenuItem', through='OrderItem', related_name='orders')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'user'], name='unique_order_per_session_user'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user'],
+                condition=models.Q(payment_method='Credit'),
+                name='order_credit_user_idx',
+            ),
+            models.Index(
+                fields=['session'],
+                condition=models.Q(payment_method='Credit'),
+                name='order_credit_session_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"
 
+class OrderItemQuerySet(models.QuerySet):
+    def aggregate_by_menu_item(self):
+        """
+        Total quantity and price per menu item name, computed in one query.
+        """
+        return (
+            self.values(name=F("menu_item__name"))
+            .annotate(
+                total_quantity=Sum("quantity"),
+                total_price=Sum(
+                    F("unit_price") * F("quantity"),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+            )
+            .order_by("name")
+        )
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menu_item = models.ForeignKey('MenuItem', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     note = models.TextField(blank=True, null=True)
+    # Menu price when the item was ordered, so later menu changes do not
+    # rewrite historical orders
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2)
+
+    objects = OrderItemQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.menu_item.price
+        super().save(*args, **kwargs)
 
     @property
     def item_total_price(self):
-        return self.menu_item.price * self.quantity
+        return self.unit_price * self.quantity
 
     def __str__(self):
         return f"{self.quantity} x {self.menu_item.name} for Order #{self.order.id}"
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+from meal_together.emails import (
+    send_invitation_email,
+    send_order_update_email,
+    send_session_update_email,
+)
+from meal_together.models.outbox import EmailEvent
+
+User = get_user_model()
+
+PENDING_EVENT_GRACE = timedelta(minutes=1)
+MAX_EVENT_ATTEMPTS = 5
+
+
+def record_email_event(kind: str, session, **payload) -> EmailEvent:
+    """
+    Write an outbox row inside the caller's transaction and hand it to a
+    worker once that transaction commits.
+    """
+    from meal_together.tasks import dispatch_email_event_task
+
+    event = EmailEvent.objects.create(kind=kind, session=session, payload=payload)
+    # A broker outage after commit must not fail the request: Django logs
+    # the error and the stale event sweep sends the event later
+    transaction.on_commit(lambda: dispatch_email_event_task.delay(event.pk), robust=True)
+    return event
+
+
+def _send_invitations(event: EmailEvent) -> None:
+    session = event.session
+    send_invitation_email(
+        event.payload["current_site"], session.participants.all(), session
+    )
+
+
+def _send_session_update(event: EmailEvent) -> None:
+    send_session_update_email(
+        event.payload["current_site"], event.payload["changes"], event.session
+    )
+
+
+def _send_order_update(event: EmailEvent) -> None:
+    user = User.objects.filter(pk=event.payload["user_id"]).first()
+    if user is None:
+        return
+    send_order_update_email(
+        event.payload["current_site"],
+        event.payload["changes"],
+        event.session,
+        user,
+        event.payload["order_id"],
+    )
+
+
+EVENT_HANDLERS = {
+    EmailEvent.INVITATION: _send_invitations,
+    EmailEvent.SESSION_UPDATE: _send_session_update,
+    EmailEvent.ORDER_UPDATE: _send_order_update,
+}
+
+
+def dispatch_email_event(event_id: int) -> bool:
+    """
+    Expand and send one pending event. Returns False when another worker
+    already holds or has processed it. A failure is counted on the event
+    before it is raised again.
+    """
+    try:
+        with transaction.atomic():
+            event = (
+                EmailEvent.objects.select_for_update(skip_locked=True, of=("self",))
+                .select_related("session__creator", "session__restaurant")
+                .filter(pk=event_id, processed_at__isnull=True)
+                .first()
+            )
+            if event is None:
+                return False
+            EVENT_HANDLERS[event.kind](event)
+            event.processed_at = now()
+            event.save(update_fields=["processed_at"])
+    except Exception as exc:
+        EmailEvent.objects.filter(pk=event_id).update(
+            attempts=F("attempts") + 1, last_error=repr(exc)
+        )
+        raise
+    return True
+
+
+def get_stale_event_ids():
+    """
+    Pending events older than the grace period, e.g. when the broker was
+    down at commit time and the dispatch task was never queued. Events that
+    failed MAX_EVENT_ATTEMPTS times are left for an admin to look at.
+    """
+    return list(
+        EmailEvent.objects.filter(
+            processed_at__isnull=True,
+            created_at__lte=now() - PENDING_EVENT_GRACE,
+            attempts__lt=MAX_EVENT_ATTEMPTS,
+        )
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:500]
+    )
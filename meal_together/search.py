@@ -0,0 +1,104 @@
+import hashlib
+import re
+from typing import Any, Dict, List
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q, QuerySet
+from meal_together.caching import bump_cache_version, get_cache_version
+from meal_together.models.restaurants import MenuItem
+
+MAX_QUERY_LENGTH = 100
+MAX_QUERY_WORDS = 8
+MENU_SEARCH_LIMIT = 50
+# Only queries asked for again within this time are served from the cache,
+# so it ends up holding the popular ones
+MENU_SEARCH_CACHE_TIMEOUT = 60 * 10
+MENU_SEARCH_VERSION_KEY = "menu_search_version"
+
+# Dish names weigh more than their type. Migration 0009 indexes the same
+# expression.
+MENU_ITEM_VECTOR = SearchVector("name", weight="A", config="simple") + SearchVector(
+    "item_type", weight="B", config="simple"
+)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())[:MAX_QUERY_LENGTH]
+
+
+def search_words(query: str) -> List[str]:
+    return re.findall(r"\w+", query)[:MAX_QUERY_WORDS]
+
+
+def prefix_search_query(words: List[str]) -> SearchQuery:
+    """
+    A query matching documents with words starting with each of the words.
+    Only word characters reach the raw tsquery, so it always parses.
+    """
+    return SearchQuery(
+        " & ".join(f"{word}:*" for word in words), search_type="raw", config="simple"
+    )
+
+
+def get_menu_search_version() -> str:
+    return get_cache_version(MENU_SEARCH_VERSION_KEY)
+
+
+def invalidate_menu_search() -> None:
+    """Any menu change may change any result, drop them all at once."""
+    bump_cache_version(MENU_SEARCH_VERSION_KEY)
+
+
+def search_menu_items(query: str, limit: int = MENU_SEARCH_LIMIT) -> QuerySet:
+    """
+    Menu items of every restaurant whose name or type has words starting
+    with each word of the query, best matches first. PostgreSQL ranks them
+    with the full-text index of migration 0009, other databases fall back to
+    substring matches ordered by name.
+    """
+    words = search_words(query)
+    items = MenuItem.objects.select_related("restaurant")
+    if not words:
+        return items.none()
+
+    if connection.vendor == "postgresql":
+        search_query = prefix_search_query(words)
+        items = (
+            items.annotate(search=MENU_ITEM_VECTOR)
+            .filter(search=search_query)
+            .annotate(rank=SearchRank(MENU_ITEM_VECTOR, search_query))
+            .order_by("-rank", "price", "pk")
+        )
+    else:
+        for word in words:
+            items = items.filter(Q(name__icontains=word) | Q(item_type__icontains=word))
+        items = items.order_by("name", "price", "pk")
+    return items[:limit]
+
+
+def get_cached_menu_search(query: str) -> List[Dict[str, Any]]:
+    """
+    Results of search_menu_items as plain data, served from the cache when
+    the same query was asked recently and no menu changed since.
+    """
+    words = search_words(query)
+    if not words:
+        return []
+    digest = hashlib.md5(" ".join(words).lower().encode()).hexdigest()
+    key = f"menu_search:{get_menu_search_version()}:{digest}"
+    results = cache.get(key)
+    if results is None:
+        results = [
+            {
+                "id": item.id,
+                "name": item.name,
+                "item_type": item.item_type,
+                "price": item.price,
+                "currency": item.currency,
+                "restaurant": {"id": item.restaurant_id, "name": item.restaurant.name},
+            }
+            for item in search_menu_items(query)
+        ]
+        cache.set(key, results, MENU_SEARCH_CACHE_TIMEOUT)
+    return results
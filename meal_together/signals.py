@@ -0,0 +1,99 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from meal_together.counters import adjust_session_totals, refresh_participant_count
+from meal_together.ledger import get_credit_contribution, update_credit_ledger
+from meal_together.directory import invalidate_directory
+from meal_together.menus import invalidate_menu
+from meal_together.models.restaurants import MenuItem, Restaurant, Tag
+from meal_together.models.sessions import MealSession, Order
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Order)
+def remember_stored_order(sender, instance, **kwargs):
+    # Keep what the stored row contributes to the ledger and session totals,
+    # so the post_save handler only has to apply the difference.
+    previous = None
+    if instance.pk:
+        previous = (
+            Order.objects.filter(pk=instance.pk).select_related("session").first()
+        )
+    instance._credit_contribution = (
+        get_credit_contribution(previous) if previous else None
+    )
+    instance._stored_total_price = previous.total_price if previous else None
+
+
+@receiver(post_save, sender=Order)
+def update_totals_on_order_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    update_credit_ledger(
+        getattr(instance, "_credit_contribution", None),
+        get_credit_contribution(instance),
+    )
+    stored_total = getattr(instance, "_stored_total_price", None)
+    if created or stored_total is None:
+        adjust_session_totals(instance.session_id, instance.total_price, 1)
+    else:
+        adjust_session_totals(instance.session_id, instance.total_price - stored_total)
+
+
+@receiver(post_delete, sender=Order)
+def update_totals_on_order_delete(sender, instance, **kwargs):
+    update_credit_ledger(get_credit_contribution(instance), None)
+    adjust_session_totals(instance.session_id, -instance.total_price, -1)
+
+
+@receiver(m2m_changed, sender=MealSession.participants.through)
+def update_participant_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # post_clear carries no pk_set, remember the user's sessions before
+        # they are cleared
+        instance._cleared_session_ids = list(
+            instance.invited_sessions.values_list("pk", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_participant_count([instance.pk])
+    elif action == "post_clear":
+        refresh_participant_count(instance.__dict__.pop("_cleared_session_ids", []))
+    elif pk_set:
+        refresh_participant_count(pk_set)
+
+
+@receiver(pre_delete, sender=User)
+def remember_participant_sessions(sender, instance, **kwargs):
+    # Participant rows are removed by the cascade without m2m_changed
+    instance._participant_session_ids = list(
+        instance.invited_sessions.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def update_participant_count_on_user_delete(sender, instance, **kwargs):
+    refresh_participant_count(getattr(instance, "_participant_session_ids", []))
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_menu_on_change(sender, instance, **kwargs):
+    invalidate_menu(instance.restaurant_id)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_directory_on_change(sender, **kwargs):
+    invalidate_directory()
+
+
+@receiver(m2m_changed, sender=Restaurant.tags.through)
+def invalidate_directory_on_tagging(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_directory()
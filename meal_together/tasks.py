@@ -1,35 +1,123 @@
+import logging
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 from django.utils.timezone import now
 from .models.sessions import MealSession
+from .mailer import (
+    EMAIL_FLUSH_SCHEDULED_KEY,
+    build_payload,
+    deliver_emails,
+    get_redis,
+    pop_queued_emails,
+    queue_email,
+    retry_failed_emails,
+)
+from .outbox import dispatch_email_event, get_stale_event_ids
 from background_task import background
 from django.template.loader import render_to_string
 
+logger = logging.getLogger(__name__)
+
+DEADLINE_SWEEP_BATCH_SIZE = 100
+# django-background-tasks queue of the periodic sweeps, run by its own
+# process_tasks program
+SWEEPING_QUEUE = "sweeping"
+
 
 @shared_task
 def send_email_task(subject,message,recipient_list):
 
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=recipient_list
+    queue_email(subject, message, recipient_list)
+
+
+@shared_task
+def send_email_batch_task(payloads):
+    """
+    Send a batch of queued payloads over the worker's pooled connection,
+    rescheduling the ones that failed.
+    """
+    outcomes = deliver_emails(payloads)
+    dropped = retry_failed_emails(outcomes["failed"])
+    return {
+        "sent": len(outcomes["sent"]),
+        "retried": len(outcomes["failed"]) - dropped,
+        "dropped": dropped,
+    }
+
+
+@shared_task
+def flush_email_queue():
+    """
+    Drain the messages coalesced during the batching window.
+    """
+    get_redis().delete(EMAIL_FLUSH_SCHEDULED_KEY)
+    totals = {"sent": 0, "retried": 0, "dropped": 0}
+    while True:
+        payloads = pop_queued_emails(settings.EMAIL_BATCH_SIZE)
+        if not payloads:
+            break
+        for key, value in send_email_batch_task(payloads).items():
+            totals[key] += value
+    return totals
+
+
+def claim_due_sessions(batch_size=DEADLINE_SWEEP_BATCH_SIZE):
+    """
+    Lock a chunk of sessions past their deadline that were not notified yet,
+    for the surrounding transaction. Rows locked by another worker are
+    skipped, so several sweepers can run at once without notifying a
+    session twice.
+    """
+    return list(
+        MealSession.objects.filter(order_deadline__lte=now(), email_sent=False)
+        .select_related("creator")
+        .select_for_update(skip_locked=True, of=("self",))
+        .order_by("order_deadline")[:batch_size]
     )
 
 
-@background(schedule=60)
+def notify_due_sessions(batch_size=DEADLINE_SWEEP_BATCH_SIZE):
+    """
+    Hand the notifications of a chunk of due sessions to the email worker in
+    one batch, and only then mark them as notified. If the hand-off fails the
+    transaction rolls back and the next sweep tries again; failed sends are
+    retried by the email worker. Returns how many sessions were claimed.
+    """
+    with transaction.atomic():
+        sessions = claim_due_sessions(batch_size)
+        if sessions:
+            payloads = [
+                build_payload(
+                    f"Deadline Passed for Session: {session.name}",
+                    render_to_string("emails/session_deadline_notification.html", {'session':session}),
+                    [session.creator.email],
+                )
+                for session in sessions
+            ]
+            send_email_batch_task.delay(payloads)
+            MealSession.objects.filter(pk__in=[session.pk for session in sessions]).update(
+                email_sent=True
+            )
+    return len(sessions)
+
+
+@background(schedule=60, queue=SWEEPING_QUEUE)
 def send_deadline_notifications():
-    current_time = now()
-    sessions = MealSession.objects.filter(order_deadline__lte=current_time, email_sent=False)
-
-    for session in sessions:
-        subject = f"Deadline Passed for Session: {session.name}"
-        message = render_to_string("emails/session_deadline_notification.html", {'session':session})
-        send_email_task.delay(
-            subject,
-            message,
-            [session.creator.email],
-        )
-        session.email_sent = True
-        session.save()
\ No newline at end of file
+    while notify_due_sessions() == DEADLINE_SWEEP_BATCH_SIZE:
+        pass
+
+
+@shared_task
+def dispatch_email_event_task(event_id):
+    dispatch_email_event(event_id)
+
+
+@background(schedule=60, queue=SWEEPING_QUEUE)
+def dispatch_pending_email_events():
+    for event_id in get_stale_event_ids():
+        # One failing event must not hold back the ones after it
+        try:
+            dispatch_email_event(event_id)
+        except Exception:
+            logger.exception("Dispatching email event %s failed", event_id)
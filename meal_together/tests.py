@@ -0,0 +1,714 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from background_task.models import Task
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from meal_together.apps import schedule_sweeps
+from meal_together.counters import find_session_drift
+from meal_together.emails import send_invitation_email
+from meal_together.helpers import (
+    get_orders_as_creditor,
+    get_orders_as_debtor,
+    update_order_total,
+)
+from meal_together.ledger import find_ledger_drift
+from meal_together.mailer import build_payload, close_pooled_connection
+from meal_together.models.credits import CreditBalance
+from meal_together.models.outbox import EmailEvent
+from meal_together.models.restaurants import MenuItem, Restaurant
+from meal_together.models.sessions import MealSession, Order, OrderItem
+from meal_together.outbox import EVENT_HANDLERS, MAX_EVENT_ATTEMPTS, get_stale_event_ids
+from meal_together.search import MENU_SEARCH_LIMIT, get_cached_menu_search, search_menu_items
+from meal_together.tasks import (
+    SWEEPING_QUEUE,
+    dispatch_pending_email_events,
+    send_deadline_notifications,
+    send_email_batch_task,
+)
+
+User = get_user_model()
+
+# Versioned cache keys must not leak between tests
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MealTogetherTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def create_users(self, count, prefix="user"):
+        return User.objects.bulk_create(
+            User(
+                username=f"{prefix}{index}",
+                email=f"{prefix}{index}@example.com",
+                first_name="First",
+                last_name=f"Last{index}",
+            )
+            for index in range(count)
+        )
+
+    def create_restaurant(self, owner, menu_size=3):
+        restaurant = Restaurant.objects.create(
+            name="Bistro", address="Main Street 1", phone_number="123456789", owner=owner
+        )
+        MenuItem.objects.bulk_create(
+            MenuItem(
+                restaurant=restaurant,
+                item_type="Main",
+                name=f"Dish {index}",
+                price=Decimal("10.00") + index,
+            )
+            for index in range(menu_size)
+        )
+        return restaurant
+
+    def create_session(self, creator, restaurant, participants, deadline=None):
+        deadline = deadline or now() + timedelta(hours=1)
+        session = MealSession.objects.create(
+            name="Lunch",
+            restaurant=restaurant,
+            creator=creator,
+            order_deadline=deadline,
+            delivery_time=deadline + timedelta(hours=1),
+        )
+        session.participants.add(creator, *participants)
+        return session
+
+    def create_order(self, session, user, menu_items, payment_method="Cash"):
+        order = Order.objects.create(session=session, user=user, payment_method=payment_method)
+        self.create_order_items(order, menu_items)
+        return order
+
+    def create_order_items(self, order, menu_items):
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=1, unit_price=item.price)
+            for item in menu_items
+        )
+
+    def order_data(self, menu_items, payment_method="Cash", order=None, quantity=1):
+        """
+        POST data of the order forms: the lines of `order` if given, with
+        their quantity changed to `quantity`, then one new line per item.
+        """
+        existing = list(order.orderitem_set.order_by("pk")) if order else []
+        lines = [(item.pk, item.menu_item_id) for item in existing]
+        lines += [(None, menu_item.pk) for menu_item in menu_items]
+        data = {
+            "payment_method": payment_method,
+            "orderitem_set-TOTAL_FORMS": str(len(lines)),
+            "orderitem_set-INITIAL_FORMS": str(len(existing)),
+            "orderitem_set-MIN_NUM_FORMS": "0",
+            "orderitem_set-MAX_NUM_FORMS": "1000",
+        }
+        for index, (pk, menu_item_id) in enumerate(lines):
+            data[f"orderitem_set-{index}-id"] = pk or ""
+            data[f"orderitem_set-{index}-menu_item"] = menu_item_id
+            data[f"orderitem_set-{index}-quantity"] = str(quantity if pk else 1)
+            data[f"orderitem_set-{index}-note"] = ""
+        return data
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class SessionPageQueryCountTests(MealTogetherTestCase):
+    """session_detail and session_summary load a session in a fixed number of queries."""
+
+    def build_session(self, participant_count):
+        creator = User.objects.create_user(
+            username=f"creator{participant_count}",
+            email=f"creator{participant_count}@example.com",
+            password="password",
+        )
+        restaurant = self.create_restaurant(creator)
+        menu_items = list(restaurant.menu_items.all()[:2])
+        participants = self.create_users(participant_count, prefix=f"p{participant_count}-")
+        session = self.create_session(creator, restaurant, participants)
+        for user in participants:
+            self.create_order(session, user, menu_items)
+        self.client.force_login(creator)
+        return session
+
+    def assert_constant_queries(self, url_name):
+        session = self.build_session(5)
+        expected = self.count_queries(reverse(url_name, args=[session.id]))
+        for participant_count in (50, 500):
+            session = self.build_session(participant_count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(reverse(url_name, args=[session.id]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_session_detail(self):
+        self.assert_constant_queries("session_detail")
+
+    def test_session_summary(self):
+        self.assert_constant_queries("session_summary")
+
+
+class HotPathIndexTests(MealTogetherTestCase):
+    """The hot filters of migration 0003 are served by an index, according to EXPLAIN."""
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "postgresql":
+            # The test tables are tiny, make the planner show which index it
+            # would use instead of scanning them
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.user = User.objects.create_user(
+            username="user", email="user@example.com", password="password"
+        )
+
+    def assert_uses_index(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"None of {index_names} in the plan:\n{plan}",
+        )
+
+    def test_deadline_sweep(self):
+        self.assert_uses_index(
+            MealSession.objects.filter(order_deadline__lte=now(), email_sent=False),
+            "session_deadline_unsent_idx",
+        )
+
+    def test_order_of_user_in_session(self):
+        self.assert_uses_index(
+            Order.objects.filter(session_id=1, user=self.user),
+            "unique_order_per_session_user",
+            # SQLite backs unique constraints with an automatic index
+            "sqlite_autoindex_meal_together_order",
+        )
+
+    def test_credit_orders_as_debtor(self):
+        self.assert_uses_index(get_orders_as_debtor(self.user), "order_credit_user_idx")
+
+    def test_credit_orders_as_creditor(self):
+        self.assert_uses_index(get_orders_as_creditor(self.user), "order_credit_session_idx")
+
+    def test_menu_items_by_type(self):
+        self.assert_uses_index(
+            MenuItem.objects.filter(restaurant_id=1, item_type="Main"),
+            "menuitem_restaurant_type_idx",
+        )
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingEmailBackend.created += 1
+
+
+class BouncingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        if any("bounce@example.com" in message.to for message in messages):
+            raise SMTPRecipientsRefused({"bounce@example.com": (550, b"No such user")})
+        return super().send_messages(messages)
+
+
+class UnreachableEmailBackend(locmem.EmailBackend):
+    def open(self):
+        raise OSError("Connection refused")
+
+
+@override_settings(
+    EMAIL_BACKEND="meal_together.tests.CountingEmailBackend",
+    EMAIL_MAX_RETRIES=2,
+    EMAIL_RETRY_BACKOFF=30,
+)
+class EmailBatchTests(TestCase):
+    """Batches go out over one pooled connection, failed messages are retried with backoff."""
+
+    def setUp(self):
+        close_pooled_connection()
+        CountingEmailBackend.created = 0
+        self.addCleanup(close_pooled_connection)
+
+    def payloads(self, *recipients):
+        return [build_payload(f"To {recipient}", "Hello", [recipient]) for recipient in recipients]
+
+    def test_batches_share_one_connection(self):
+        send_email_batch_task(self.payloads("a@example.com", "b@example.com"))
+        send_email_batch_task(self.payloads("c@example.com"))
+
+        self.assertEqual(
+            [message.to for message in mail.outbox],
+            [["a@example.com"], ["b@example.com"], ["c@example.com"]],
+        )
+        self.assertEqual(CountingEmailBackend.created, 1)
+
+    @override_settings(EMAIL_BACKEND="meal_together.tests.BouncingEmailBackend")
+    def test_failed_message_is_retried_with_backoff(self):
+        payloads = self.payloads("a@example.com", "bounce@example.com")
+        payloads[1]["attempt"] = 1
+        with mock.patch.object(send_email_batch_task, "apply_async") as apply_async, \
+                self.assertLogs("meal_together.mailer", "ERROR"):
+            result = send_email_batch_task(payloads)
+
+        self.assertEqual(result, {"sent": 1, "retried": 1, "dropped": 0})
+        self.assertEqual([message.to for message in mail.outbox], [["a@example.com"]])
+        retried = apply_async.call_args.kwargs
+        self.assertEqual(retried["args"][0][0]["recipient_list"], ["bounce@example.com"])
+        self.assertEqual(retried["args"][0][0]["attempt"], 2)
+        self.assertEqual(retried["countdown"], 60)
+
+    @override_settings(EMAIL_BACKEND="meal_together.tests.BouncingEmailBackend")
+    def test_message_is_dropped_after_max_retries(self):
+        payloads = self.payloads("bounce@example.com")
+        payloads[0]["attempt"] = 2
+        with mock.patch.object(send_email_batch_task, "apply_async") as apply_async, \
+                self.assertLogs("meal_together.mailer", "ERROR"):
+            result = send_email_batch_task(payloads)
+
+        self.assertEqual(result, {"sent": 0, "retried": 0, "dropped": 1})
+        apply_async.assert_not_called()
+
+    @override_settings(EMAIL_BACKEND="meal_together.tests.UnreachableEmailBackend")
+    def test_unreachable_server_retries_whole_batch(self):
+        with mock.patch.object(send_email_batch_task, "apply_async") as apply_async, \
+                self.assertLogs("meal_together.mailer", "ERROR"):
+            result = send_email_batch_task(self.payloads("a@example.com", "b@example.com"))
+
+        self.assertEqual(result, {"sent": 0, "retried": 2, "dropped": 0})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(apply_async.call_count, 2)
+
+
+class OrderItemFormSetQueryTests(MealTogetherTestCase):
+    """Order forms share one evaluated menu, whatever the number of lines."""
+
+    def setUp(self):
+        super().setUp()
+        self.creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        self.small, self.large = self.create_users(2)
+        self.restaurant = self.create_restaurant(self.creator, menu_size=20)
+        self.menu_items = list(self.restaurant.menu_items.order_by("pk"))
+        self.session = self.create_session(
+            self.creator, self.restaurant, [self.small, self.large]
+        )
+        self.client.force_login(self.creator)
+
+    def post_order(self, user, lines):
+        url = reverse("create_order", args=[self.session.id, user.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, self.order_data(self.menu_items[:lines]))
+        self.assertRedirects(
+            response,
+            reverse("session_detail", args=[self.session.id]),
+            fetch_redirect_response=False,
+        )
+        return len(queries)
+
+    def test_create_order_validates_lines_without_queries(self):
+        # Warm the menu cache
+        self.client.get(reverse("create_order", args=[self.session.id, self.small.id]))
+        one_line = self.post_order(self.small, 1)
+        twenty_lines = self.post_order(self.large, 20)
+
+        # Only the inserts of the extra lines add queries
+        self.assertEqual(twenty_lines - one_line, 19)
+        self.assertEqual(Order.objects.get(user=self.large).orderitem_set.count(), 20)
+
+    def test_edit_order_renders_lines_without_queries(self):
+        self.create_order(self.session, self.small, self.menu_items[:1])
+        self.create_order(self.session, self.large, self.menu_items)
+
+        # Warm the menu cache
+        self.client.get(reverse("create_order", args=[self.session.id, self.creator.id]))
+        one_line = self.count_queries(reverse("edit_order", args=[self.session.id, self.small.id]))
+        with self.assertNumQueries(one_line):
+            response = self.client.get(
+                reverse("edit_order", args=[self.session.id, self.large.id])
+            )
+        self.assertEqual(len(response.context["formset"].forms), 23)
+
+
+class MenuSearchTests(MealTogetherTestCase):
+    """Menu search matches word prefixes, with full-text search on PostgreSQL only."""
+
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create_user(
+            username="owner", email="owner@example.com", password="password"
+        )
+        self.restaurant = self.create_restaurant(owner, menu_size=0)
+        MenuItem.objects.bulk_create(
+            MenuItem(restaurant=self.restaurant, item_type=item_type, name=name, price=price)
+            for item_type, name, price in [
+                ("Main", "Pierogi ruskie", Decimal("20.00")),
+                ("Main", "Pizza margherita", Decimal("30.00")),
+                ("Soup", "Tomato soup", Decimal("12.00")),
+            ]
+        )
+
+    def names(self, query):
+        return [item.name for item in search_menu_items(query)]
+
+    def test_matches_word_prefixes(self):
+        self.assertEqual(self.names("pier"), ["Pierogi ruskie"])
+        self.assertEqual(self.names("PIZZA marg"), ["Pizza margherita"])
+        self.assertEqual(self.names("soup"), ["Tomato soup"])
+        self.assertEqual(self.names("pierogi pizza"), [])
+
+    def test_ignores_punctuation_only_queries(self):
+        self.assertEqual(self.names(""), [])
+        self.assertEqual(self.names("&|!:*"), [])
+
+    def test_results_are_capped(self):
+        MenuItem.objects.bulk_create(
+            MenuItem(restaurant=self.restaurant, item_type="Main", name=f"Pierogi {index}", price=10)
+            for index in range(MENU_SEARCH_LIMIT)
+        )
+        self.assertEqual(len(self.names("pierogi")), MENU_SEARCH_LIMIT)
+
+    def test_fallback_matches_substrings(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("PostgreSQL matches word prefixes only")
+        self.assertEqual(self.names("rogi"), ["Pierogi ruskie"])
+
+    def test_cached_results_follow_menu_changes(self):
+        self.assertEqual(
+            [item["name"] for item in get_cached_menu_search("pier")], ["Pierogi ruskie"]
+        )
+        with self.assertNumQueries(0):
+            get_cached_menu_search("Pier")
+
+        MenuItem.objects.create(
+            restaurant=self.restaurant, item_type="Main", name="Pierogi z mięsem", price=22
+        )
+        self.assertEqual(
+            sorted(item["name"] for item in get_cached_menu_search("pier")),
+            ["Pierogi ruskie", "Pierogi z mięsem"],
+        )
+
+
+class OutboxSweepTests(MealTogetherTestCase):
+    """The stale event sweep gets past events whose handler fails."""
+
+    def setUp(self):
+        super().setUp()
+        creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        session = self.create_session(creator, self.create_restaurant(creator), [])
+        self.poison = EmailEvent.objects.create(kind=EmailEvent.ORDER_UPDATE, session=session)
+        self.event = EmailEvent.objects.create(kind=EmailEvent.SESSION_UPDATE, session=session)
+        EmailEvent.objects.update(created_at=now() - timedelta(minutes=5))
+
+    def fail(self, event):
+        raise ValueError("Broken payload")
+
+    def test_failing_event_does_not_block_later_ones(self):
+        handlers = {EmailEvent.ORDER_UPDATE: self.fail, EmailEvent.SESSION_UPDATE: lambda event: None}
+        with mock.patch.dict(EVENT_HANDLERS, handlers), \
+                self.assertLogs("meal_together.tasks", "ERROR"):
+            dispatch_pending_email_events.now()
+
+        self.poison.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertIsNone(self.poison.processed_at)
+        self.assertEqual(self.poison.attempts, 1)
+        self.assertIn("Broken payload", self.poison.last_error)
+        self.assertIsNotNone(self.event.processed_at)
+
+    def test_sweep_gives_up_after_max_attempts(self):
+        EmailEvent.objects.filter(pk=self.poison.pk).update(attempts=MAX_EVENT_ATTEMPTS)
+        self.assertEqual(get_stale_event_ids(), [self.event.pk])
+
+
+class SweepSchedulingTests(TestCase):
+    """migrate leaves exactly one of each sweep, on the sweeping queue."""
+
+    def test_migrate_schedules_sweeps_once(self):
+        Task.objects.all().delete()
+        # As scheduled before the sweeps had their own queue
+        send_deadline_notifications(repeat=60, queue=None)
+
+        schedule_sweeps(sender=None)
+        schedule_sweeps(sender=None)
+
+        self.assertCountEqual(
+            Task.objects.values_list("task_name", "queue"),
+            [
+                (send_deadline_notifications.name, SWEEPING_QUEUE),
+                (dispatch_pending_email_events.name, SWEEPING_QUEUE),
+            ],
+        )
+
+
+class OrderTotalTests(MealTogetherTestCase):
+    """update_order_total applies its deltas against the stored order."""
+
+    def test_stale_order_instance(self):
+        creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        (user,) = self.create_users(1)
+        restaurant = self.create_restaurant(creator)
+        menu_items = list(restaurant.menu_items.order_by("pk"))
+        session = self.create_session(creator, restaurant, [user])
+        order = self.create_order(session, user, menu_items[:1], payment_method="Credit")
+        update_order_total(order)
+
+        # Loaded by one request, while another one adds a line first
+        stale = Order.objects.get(pk=order.pk)
+        self.create_order_items(order, menu_items[1:2])
+        update_order_total(Order.objects.get(pk=order.pk))
+        self.create_order_items(order, menu_items[2:3])
+        update_order_total(stale)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).total_price, Decimal("33.00"))
+        self.assertEqual(find_ledger_drift(), [])
+        self.assertEqual(find_session_drift(), [])
+
+
+async def read_stream(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+class RequestMetricsTests(MealTogetherTestCase):
+    """Streaming responses are recorded with the queries run for their body."""
+
+    def test_export_is_recorded_once_streamed(self):
+        creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        users = self.create_users(3)
+        restaurant = self.create_restaurant(creator)
+        session = self.create_session(creator, restaurant, users)
+        for user in users:
+            self.create_order(session, user, restaurant.menu_items.all(), payment_method="Credit")
+        self.client.force_login(users[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("export_order_history"), {"format": "csv"})
+            self.assertFalse(hasattr(response, "request_metrics"))
+            async_to_sync(read_stream)(response.streaming_content)
+
+        self.assertEqual(response.request_metrics["view"], "export_order_history")
+        self.assertEqual(response.request_metrics["queries"], len(queries))
+        self.assertNotIn(f'"{len(queries)} queries"', response["Server-Timing"])
+
+
+class CreditLedgerTests(MealTogetherTestCase):
+    """The incremental credit ledger matches the order history after every change."""
+
+    def setUp(self):
+        super().setUp()
+        self.creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        self.debtor, self.other = self.create_users(2)
+        self.restaurant = self.create_restaurant(self.creator)
+        self.menu_items = list(self.restaurant.menu_items.order_by("pk"))
+        self.session = self.create_session(self.creator, self.restaurant, [self.debtor, self.other])
+        self.client.force_login(self.creator)
+
+    def assert_consistent(self):
+        self.assertEqual(find_ledger_drift(), [])
+        self.assertEqual(find_session_drift(), [])
+
+    def post(self, url_name, user, data):
+        response = self.client.post(reverse(url_name, args=[self.session.id, user.id]), data)
+        self.assertRedirects(
+            response,
+            reverse("session_detail", args=[self.session.id]),
+            fetch_redirect_response=False,
+        )
+
+    def edit(self, user, payment_method, menu_items=(), quantity=1):
+        order = Order.objects.get(session=self.session, user=user)
+        self.post("edit_order", user, self.order_data(menu_items, payment_method, order, quantity))
+
+    def debt(self, user):
+        balance = CreditBalance.objects.filter(user=user, counterparty=self.creator).first()
+        return balance.balance if balance else Decimal("0")
+
+    def test_order_changes(self):
+        self.post("create_order", self.debtor, self.order_data(self.menu_items[:2], "Credit"))
+        self.assertEqual(self.debt(self.debtor), Decimal("21.00"))
+        self.assert_consistent()
+
+        self.edit(self.debtor, "Credit", quantity=2)
+        self.assertEqual(self.debt(self.debtor), Decimal("42.00"))
+        self.assert_consistent()
+
+        self.edit(self.debtor, "Cash", quantity=2)
+        self.assertEqual(self.debt(self.debtor), Decimal("0"))
+        self.assert_consistent()
+
+        self.edit(self.debtor, "Credit", quantity=2)
+        self.assertEqual(self.debt(self.debtor), Decimal("42.00"))
+        self.assert_consistent()
+
+        # New lines are priced as the item is now, older ones keep their price
+        MenuItem.objects.filter(pk=self.menu_items[2].pk).update(price=Decimal("50.00"))
+        self.edit(self.debtor, "Credit", self.menu_items[2:], quantity=2)
+        self.assertEqual(self.debt(self.debtor), Decimal("92.00"))
+        self.assert_consistent()
+
+        self.post("edit_order", self.debtor, {"cancel_order": ""})
+        self.assertEqual(self.debt(self.debtor), Decimal("0"))
+        self.assert_consistent()
+
+    def test_cascading_deletes(self):
+        for user in (self.debtor, self.other):
+            self.post("create_order", user, self.order_data(self.menu_items, "Credit"))
+        self.assert_consistent()
+
+        self.debtor.delete()
+        self.assert_consistent()
+
+        self.session.delete()
+        self.assertEqual(self.debt(self.other), Decimal("0"))
+        self.assert_consistent()
+
+    def test_rebuild_credit_ledger_check(self):
+        self.post("create_order", self.debtor, self.order_data(self.menu_items, "Credit"))
+        call_command("rebuild_credit_ledger", "--check", stdout=StringIO())
+
+        CreditBalance.objects.update(balance=F("balance") + 1)
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_credit_ledger", "--check", stdout=output)
+        self.assertIn(f"user {self.debtor.pk} -> {self.creator.pk}", output.getvalue())
+
+        call_command("rebuild_credit_ledger", stdout=StringIO())
+        self.assertEqual(self.debt(self.debtor), Decimal("33.00"))
+        call_command("rebuild_credit_ledger", "--check", stdout=StringIO())
+
+
+class SessionCounterTests(MealTogetherTestCase):
+    """Stored session counters follow participant changes from either side."""
+
+    def setUp(self):
+        super().setUp()
+        self.creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        self.users = self.create_users(3)
+        restaurant = self.create_restaurant(self.creator)
+        self.sessions = [
+            self.create_session(self.creator, restaurant, self.users[:2]) for _ in range(2)
+        ]
+
+    def assert_counts(self, *counts):
+        self.assertEqual(find_session_drift(), [])
+        self.assertEqual(
+            [session.participant_count for session in MealSession.objects.order_by("pk")],
+            list(counts),
+        )
+
+    def test_participant_changes(self):
+        first, second = self.sessions
+        self.assert_counts(3, 3)
+
+        first.participants.add(self.users[2])
+        self.assert_counts(4, 3)
+
+        first.participants.remove(self.users[0])
+        self.assert_counts(3, 3)
+
+        self.users[2].invited_sessions.add(second)
+        self.assert_counts(3, 4)
+
+        self.users[1].invited_sessions.remove(first)
+        self.assert_counts(2, 4)
+
+        self.users[2].invited_sessions.clear()
+        self.assert_counts(1, 3)
+
+        second.participants.clear()
+        self.assert_counts(1, 0)
+
+    def test_user_delete(self):
+        restaurant = self.sessions[0].restaurant
+        self.create_order(self.sessions[0], self.users[0], restaurant.menu_items.all())
+        self.users[0].delete()
+        self.assert_counts(2, 2)
+
+    def test_recompute_session_totals_check(self):
+        call_command("recompute_session_totals", "--check", stdout=StringIO())
+
+        MealSession.objects.filter(pk=self.sessions[0].pk).update(participant_count=99)
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("recompute_session_totals", "--check", stdout=output)
+        self.assertIn(f"session {self.sessions[0].pk}:", output.getvalue())
+
+        call_command("recompute_session_totals", stdout=StringIO())
+        self.assert_counts(3, 3)
+        call_command("recompute_session_totals", "--check", stdout=StringIO())
+
+
+class CreditBalanceApiTests(MealTogetherTestCase):
+    """Conditional balance requests aggregate the balances once."""
+
+    def test_not_modified(self):
+        creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        (user,) = self.create_users(1)
+        restaurant = self.create_restaurant(creator)
+        session = self.create_session(creator, restaurant, [user])
+        self.create_order(session, user, restaurant.menu_items.all(), payment_method="Credit")
+        update_order_total(Order.objects.get(session=session, user=user))
+        self.client.force_login(user)
+
+        url = reverse("api_credit_balance")
+        response = self.client.get(url)
+        self.assertEqual(Decimal(response.json()["total_balance"]), Decimal("33.00"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url,
+                HTTP_IF_NONE_MATCH=response["ETag"],
+                HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+            )
+        self.assertEqual(response.status_code, 304)
+        balance_queries = [
+            query for query in queries if "meal_together_creditbalance" in query["sql"]
+        ]
+        self.assertEqual(len(balance_queries), 1)
+
+
+class InvitationEmailTests(MealTogetherTestCase):
+    """Invitations go to every participant with an email address but the creator."""
+
+    def test_recipients(self):
+        creator = User.objects.create_user(
+            username="creator", email="creator@example.com", password="password"
+        )
+        invited, without_email = self.create_users(2)
+        User.objects.filter(pk=without_email.pk).update(email="")
+        restaurant = self.create_restaurant(creator)
+        session = self.create_session(creator, restaurant, [invited, without_email])
+
+        with mock.patch("meal_together.emails.queue_emails") as queue_emails:
+            send_invitation_email("testserver", session.participants.all(), session)
+
+        (payloads,), _ = queue_emails.call_args
+        self.assertEqual([payload["recipient_list"] for payload in payloads], [[invited.email]])
+        self.assertIn(f"/create_order/{invited.pk}/", payloads[0]["message"])
@@ -1,14 +1,18 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView, PasswordResetView
 from meal_together.views.users import register_view, login_view, profile_view,edit_profile, activate_view
-from meal_together.views.restaurants import create_restaurant, restaurant_list, restaurant_detail
+from meal_together.views.restaurants import create_restaurant, restaurant_list, restaurant_detail, import_menu_view, export_menu_view, menu_search
 from meal_together.views.general import no_permission_view, redirect_to_sessions_or_login
-from meal_together.views.sessions import session_list, create_session, create_order,edit_order, session_detail,session_edit, credit_balance_view, session_summary
+from meal_together.views.sessions import session_list, create_session, create_order,edit_order, session_detail,session_edit, credit_balance_view, session_summary, export_session_summary, export_order_history
+from meal_together.views.events import session_events
+from meal_together.views.metrics import request_metrics
+from meal_together.views.api import api_session_list, api_session_detail, api_restaurant_menu, api_credit_balance, api_menu_search
 
 urlpatterns = [
     # General
     path('', redirect_to_sessions_or_login, name='home'),
     path('no-permission/', no_permission_view, name='no_permission'),
+    path('metrics/requests/', request_metrics, name='request_metrics'),
     # Users
     path('register/', register_view, name='register'),
     path('login/', login_view, name='login'),
@@ -19,7 +23,10 @@ urlpatterns = [
     # Restaurants
     path('restaurants/', restaurant_list, name='restaurant_list'),
     path('restaurants/create/', create_restaurant, name='create_restaurant'),
+    path('restaurants/menu-search/', menu_search, name='menu_search'),
     path('restaurants/<int:restaurant_id>/', restaurant_detail, name='restaurant_detail'),
+    path('restaurants/<int:restaurant_id>/menu/import/', import_menu_view, name='import_menu'),
+    path('restaurants/<int:restaurant_id>/menu/export/', export_menu_view, name='export_menu'),
     # Sessions
     path('sessions/', session_list, name='session_list'),
     path('sessions/create/', create_session, name='create_session'),
@@ -28,7 +35,16 @@ urlpatterns = [
     path('sessions/<int:session_id>/edit_order/<int:user_id>/', edit_order, name='edit_order'),
     path('sessions/<int:session_id>/edit/', session_edit, name='session_edit'),
     path('sessions/<int:session_id>/summary/', session_summary, name='session_summary'),
+    path('sessions/<int:session_id>/summary/export/', export_session_summary, name='export_session_summary'),
+    path('sessions/<int:session_id>/events/', session_events, name='session_events'),
     path('credit_balance/', credit_balance_view, name='credit_balance'),
+    path('credit_balance/export/', export_order_history, name='export_order_history'),
+    # JSON API
+    path('api/sessions/', api_session_list, name='api_session_list'),
+    path('api/sessions/<int:session_id>/', api_session_detail, name='api_session_detail'),
+    path('api/restaurants/<int:restaurant_id>/menu/', api_restaurant_menu, name='api_restaurant_menu'),
+    path('api/menu/search/', api_menu_search, name='api_menu_search'),
+    path('api/credit_balance/', api_credit_balance, name='api_credit_balance'),
     # Password reset
     path('password_reset/', PasswordResetView.as_view(), name='password_reset'),
     path('password_reset/done/', PasswordResetDoneView.as_view(), name='password_reset_done'),
@@ -0,0 +1,197 @@
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Count, Max, Q, Sum
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.timezone import now
+from django.views.decorators.http import condition, require_GET
+from meal_together.helpers import get_credit_balances, process_participants
+from meal_together.menus import get_cached_menu, get_menu_version
+from meal_together.search import get_cached_menu_search, normalize_query
+from meal_together.models.credits import CreditBalance
+from meal_together.models.restaurants import Restaurant
+from meal_together.models.sessions import MealSession
+
+PAST_SESSIONS_PER_PAGE = 20
+
+
+def serialize_user(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+    }
+
+
+def serialize_session(session):
+    return {
+        "id": session.id,
+        "name": session.name,
+        "restaurant": {"id": session.restaurant_id, "name": session.restaurant.name},
+        "creator": serialize_user(session.creator),
+        "order_deadline": session.order_deadline,
+        "delivery_time": session.delivery_time,
+        "is_active": session.is_active(),
+        "total_spent": session.total_spent,
+        "order_count": session.order_count,
+        "participant_count": session.participant_count,
+        "version": session.version,
+    }
+
+
+# Conditional GET helpers. They only read version columns, so an unchanged
+# poll is answered with 304 before the view does any real work.
+
+
+def session_list_etag(request):
+    # Sessions move from active to past when their deadline passes, so the
+    # number of active ones is part of the tag as well
+    state = MealSession.objects.filter(participants=request.user).aggregate(
+        count=Count("pk"),
+        active=Count("pk", filter=Q(order_deadline__gte=now())),
+        versions=Sum("version"),
+    )
+    return (
+        f'"sessions-{request.user.id}-{state["count"]}-{state["active"]}-'
+        f'{state["versions"] or 0}-{request.GET.get("page", 1)}"'
+    )
+
+
+def session_detail_etag(request, session_id):
+    state = (
+        MealSession.objects.filter(pk=session_id)
+        .values("version", "order_deadline")
+        .first()
+    )
+    if state is None:
+        return None
+    is_active = int(now() <= state["order_deadline"])
+    return f'"session-{session_id}-{state["version"]}-{is_active}"'
+
+
+def menu_etag(request, restaurant_id):
+    return f'"menu-{restaurant_id}-{get_menu_version(restaurant_id)}"'
+
+
+def _balances_state(request):
+    # Both the ETag and Last-Modified are taken from it, aggregate once
+    if not hasattr(request, "_balances_state"):
+        request._balances_state = CreditBalance.objects.filter(user=request.user).aggregate(
+            count=Count("pk"), last_modified=Max("updated_at")
+        )
+    return request._balances_state
+
+
+def balances_etag(request):
+    state = _balances_state(request)
+    last_modified = state["last_modified"].timestamp() if state["last_modified"] else 0
+    return f'"balances-{request.user.id}-{state["count"]}-{last_modified}-{request.GET.urlencode()}"'
+
+
+def balances_last_modified(request):
+    return _balances_state(request)["last_modified"]
+
+
+@require_GET
+@login_required
+@condition(etag_func=session_list_etag)
+def api_session_list(request):
+    sessions = MealSession.objects.for_participant(request.user)
+    past_sessions = Paginator(sessions.past(), PAST_SESSIONS_PER_PAGE).get_page(
+        request.GET.get("page")
+    )
+    return JsonResponse(
+        {
+            "active_sessions": [serialize_session(s) for s in sessions.active()],
+            "past_sessions": [serialize_session(s) for s in past_sessions],
+            "page": past_sessions.number,
+            "num_pages": past_sessions.paginator.num_pages,
+        }
+    )
+
+
+@require_GET
+@login_required
+@condition(etag_func=session_detail_etag)
+def api_session_detail(request, session_id):
+    session = get_object_or_404(
+        MealSession.objects.select_related("restaurant", "creator"), id=session_id
+    )
+    participants_data = process_participants(session, include_creator_info=True)
+    participants_data.sort(key=lambda x: not x["is_creator"])
+
+    data = serialize_session(session)
+    data["participants"] = [
+        {
+            "user": serialize_user(participant["user"]),
+            "is_creator": participant["is_creator"],
+            "total_spent": participant["total_spent"],
+            "payment_methods": participant["payment_methods"],
+            "items": [
+                {
+                    "name": item.menu_item.name,
+                    "quantity": item.quantity,
+                    "unit_price": item.unit_price,
+                    "note": item.note,
+                }
+                for order in participant["orders"]
+                for item in order.orderitem_set.all()
+            ],
+        }
+        for participant in participants_data
+    ]
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+@condition(etag_func=menu_etag)
+def api_restaurant_menu(request, restaurant_id):
+    restaurant = get_object_or_404(Restaurant, id=restaurant_id)
+    menu = get_cached_menu(restaurant.id)
+    return JsonResponse(
+        {
+            "id": restaurant.id,
+            "name": restaurant.name,
+            "menu": {
+                item_type: [
+                    {
+                        "id": item.id,
+                        "name": item.name,
+                        "price": item.price,
+                        "currency": item.currency,
+                    }
+                    for item in items
+                ]
+                for item_type, items in menu["grouped"].items()
+            },
+        }
+    )
+
+
+@require_GET
+@login_required
+def api_menu_search(request):
+    query = normalize_query(request.GET.get("q", ""))
+    return JsonResponse({"query": query, "results": get_cached_menu_search(query)})
+
+
+@require_GET
+@login_required
+@condition(etag_func=balances_etag, last_modified_func=balances_last_modified)
+def api_credit_balance(request):
+    balances = get_credit_balances(request.user, ordering=request.GET.get("sort", "amount"))
+    total_balance = (
+        CreditBalance.objects.filter(user=request.user).aggregate(total=Sum("balance"))["total"]
+        or 0
+    )
+    return JsonResponse(
+        {
+            "total_balance": total_balance,
+            "balances": [
+                {"user": serialize_user(entry.counterparty), "balance": entry.balance}
+                for entry in balances
+            ],
+        }
+    )
@@ -0,0 +1,49 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.http import require_GET
+from meal_together.events import get_event_backend, session_channel
+from meal_together.models.sessions import MealSession
+
+# Ask browsers to wait this long before reconnecting a dropped stream
+RECONNECT_DELAY_MS = 5000
+
+
+async def stream_session_events(session_id):
+    # Subscribe before sending anything, so no event after connecting is missed
+    async with get_event_backend().subscribe(session_channel(session_id)) as messages:
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        async for message in messages:
+            if message is None:
+                # Keep-alive comment so proxies do not close an idle stream
+                yield ": ping\n\n"
+            else:
+                yield f"data: {message}\n\n"
+
+
+def release_connection():
+    # The stream never queries, give the request's pooled connection back
+    # instead of holding it for as long as the client listens
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+@require_GET
+@login_required
+async def session_events(request, session_id):
+    """
+    Server-Sent Events stream of order changes in a session. The stream
+    stays open for as long as the client listens, so it must be served by
+    the ASGI application in app/asgi.py rather than a WSGI worker.
+    """
+    session = await aget_object_or_404(MealSession, id=session_id)
+    await sync_to_async(release_connection)()
+    response = StreamingHttpResponse(
+        stream_session_events(session.id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
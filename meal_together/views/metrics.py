@@ -0,0 +1,15 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+from meal_together.instrumentation import exceeded_thresholds, recent_requests
+
+
+@staff_member_required
+def request_metrics(request):
+    """
+    Recent sampled requests of this process, slowest first.
+    """
+    records = sorted(recent_requests, key=lambda record: record["total_ms"], reverse=True)
+    rows = [
+        {"record": record, "exceeded": exceeded_thresholds(record)} for record in records
+    ]
+    return render(request, "general/request_metrics.html", {"rows": rows})
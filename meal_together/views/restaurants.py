@@ -1,18 +1,35 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from meal_together.models.restaurants import Restaurant, MenuItem
-from meal_together.forms.restaurants import RestaurantForm, MenuItemForm
-from itertools import groupby
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from meal_together.models.restaurants import Restaurant
+from meal_together.forms.restaurants import RestaurantForm, MenuItemForm, MenuImportForm
+from meal_together.menus import get_cached_menu
+from meal_together.directory import get_cached_directory_page, get_cached_tag_names
+from meal_together.search import MENU_SEARCH_LIMIT, get_cached_menu_search, normalize_query
+from meal_together.menu_files import MENU_FILE_FORMATS, export_menu, import_menu, read_menu_file
 
 def is_manager_or_admin(user):
     return user.is_superuser or user.groups.filter(name='Manager').exists()
 
 @login_required
 def restaurant_list(request):
-    restaurants = Restaurant.objects.all()
+    query = normalize_query(request.GET.get('q', ''))
+    tag = request.GET.get('tag', '').strip()
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        number = 1
+
+    page = get_cached_directory_page(query, tag, number)
     user_in_group = request.user.groups.filter(name__in=['Manager', 'Admin']).exists()
     return render(request, 'restaurants/restaurant_list.html', {
-        'restaurants': restaurants,
+        'restaurants': page['restaurants'],
+        'page': page,
+        'query': query,
+        'tag': tag,
+        'tag_names': get_cached_tag_names(),
         'user_in_group': user_in_group
     })
 
@@ -36,11 +53,7 @@ def create_restaurant(request):
 @login_required
 def restaurant_detail(request, restaurant_id):
     restaurant = get_object_or_404(Restaurant, id=restaurant_id)
-    menu_items = MenuItem.objects.filter(restaurant=restaurant).order_by('item_type')
-
-    grouped_menu = {}
-    for item_type, items in groupby(menu_items, lambda x: x.item_type):
-        grouped_menu[item_type] = list(items)
+    grouped_menu = get_cached_menu(restaurant.id)['grouped']
 
     user_in_group = request.user.is_authenticated and request.user.groups.filter(name__in=['Manager', 'Admin']).exists()
 
@@ -60,3 +73,53 @@ def restaurant_detail(request, restaurant_id):
         'user_in_group': user_in_group,
         'form': form
     })
+
+
+@login_required
+@user_passes_test(is_manager_or_admin, login_url='/no-permission/')
+def import_menu_view(request, restaurant_id):
+    restaurant = get_object_or_404(Restaurant, id=restaurant_id)
+    result = None
+
+    if request.method == 'POST':
+        form = MenuImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            rows = read_menu_file(form.cleaned_data['file'], form.cleaned_data['file_format'])
+            try:
+                result = import_menu(restaurant, rows)
+            except ValidationError as error:
+                form.add_error('file', error)
+    else:
+        form = MenuImportForm()
+
+    return render(request, 'restaurants/import_menu.html', {
+        'restaurant': restaurant,
+        'form': form,
+        'result': result,
+    })
+
+
+@require_GET
+@login_required
+async def export_menu_view(request, restaurant_id):
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in MENU_FILE_FORMATS:
+        raise Http404('Unknown menu format.')
+    restaurant = await aget_object_or_404(Restaurant, id=restaurant_id)
+
+    response = StreamingHttpResponse(
+        export_menu(restaurant.id, file_format),
+        content_type=MENU_FILE_FORMATS[file_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="menu-{restaurant.id}.{file_format}"'
+    return response
+
+
+@login_required
+def menu_search(request):
+    query = normalize_query(request.GET.get('q', ''))
+    return render(request, 'restaurants/menu_search.html', {
+        'query': query,
+        'results': get_cached_menu_search(query),
+        'limit': MENU_SEARCH_LIMIT,
+    })
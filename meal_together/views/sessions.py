@@ -1,9 +1,15 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import get_user_model
 from django.contrib.sites.shortcuts import get_current_site
 from django.contrib.auth.decorators import login_required
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.http import Http404
 from meal_together.models.sessions import MealSession, Order
-from meal_together.models.restaurants import MenuItem
+from meal_together.models.credits import CreditBalance
+from meal_together.models.outbox import EmailEvent
 from meal_together.forms.sessions import (
     MealSessionForm,
     OrderItemFormSet,
@@ -12,54 +18,60 @@ from meal_together.forms.sessions import (
 from meal_together.helpers import (
     get_order_changes,
     get_session_changes,
-    process_participants,
     aggregate_order_items,
-    get_orders_as_creditor,
-    get_orders_as_debtor,
-    format_balances_for_view,
-    calculate_balances,
+    build_participants_data,
+    get_credit_balances,
+    get_session_orders,
+    load_page,
+    run_queries,
+    update_order_total,
 )
 from django.utils.timezone import now
 from django.contrib import messages
-from collections import defaultdict
-from meal_together.emails import (
-    send_invitation_email,
-    send_order_update_email,
-    send_session_update_email,
+from meal_together.outbox import record_email_event
+from meal_together.events import (
+    ORDER_CANCELED,
+    ORDER_CREATED,
+    ORDER_UPDATED,
+    publish_order_event,
 )
-from collections import defaultdict
+from meal_together.menus import get_cached_menu
+from meal_together.exports import (
+    EXPORT_FORMATS,
+    export_response,
+    order_history_sheets,
+    session_summary_sheets,
+)
+from meal_together.counters import touch_session
 
 User = get_user_model()
 
+PAST_SESSIONS_PER_PAGE = 20
+BALANCES_PER_PAGE = 25
 
-@login_required
-def session_list(request):
-    user = request.user
-
-    active_sessions = MealSession.objects.filter(
-        participants=user, order_deadline__gte=now()
-    ).order_by("order_deadline")
-    past_sessions = MealSession.objects.filter(
-        participants=user, order_deadline__lt=now()
-    ).order_by("-order_deadline")
-
-    user_orders = Order.objects.filter(user=user)
+# Templates may still touch lazy relations and request.user, so the read
+# views render on the sync thread once their queries are done
+arender = sync_to_async(render)
 
-    session_orders = {order.session.id: order for order in user_orders}
 
-    for session in active_sessions:
-        session.user_expense = session.total_spent_by_user(user)
-        session.order = session_orders.get(session.id)
-
-    for session in past_sessions:
-        session.user_expense = session.total_spent_by_user(user)
-        session.order = session_orders.get(session.id)
-
-    total_spent = sum(session.user_expense for session in active_sessions) + sum(
-        session.user_expense for session in past_sessions
+@login_required
+async def session_list(request):
+    user = await request.auser()
+
+    sessions = MealSession.objects.for_participant(user).with_user_spend(user)
+
+    active_sessions, past_sessions, total_spent = await run_queries(
+        lambda: list(sessions.active()),
+        lambda: load_page(
+            sessions.past(), PAST_SESSIONS_PER_PAGE, request.GET.get("page")
+        ),
+        lambda: Order.objects.filter(user=user, session__participants=user).aggregate(
+            total=Sum("total_price")
+        )["total"]
+        or 0,
     )
 
-    return render(
+    return await arender(
         request,
         "sessions/session_list.html",
         {
@@ -75,26 +87,25 @@ def create_session(request):
     if request.method == "POST":
         form = MealSessionForm(request.POST, user=request.user)
         if form.is_valid():
-            session = form.save(commit=False)
-            session.creator = request.user
-            session.save()
-            form.save_m2m()
-
-            session.participants.add(request.user)
-
-            invited_users = list(session.participants.all())
-
-            selected_groups = form.cleaned_data.get("groups")
-            if selected_groups:
-                group_users = User.objects.filter(groups__in=selected_groups).distinct()
-                session.participants.add(*group_users)
-                invited_users.extend(group_users)
-
-            invited_users = set(invited_users)
-
-            current_site = get_current_site(request)
-
-            send_invitation_email(current_site, invited_users, session)
+            with transaction.atomic():
+                session = form.save(commit=False)
+                session.creator = request.user
+                session.save()
+                form.save_m2m()
+
+                session.participants.add(request.user)
+
+                selected_groups = form.cleaned_data.get("groups")
+                if selected_groups:
+                    group_users = User.objects.filter(groups__in=selected_groups).distinct()
+                    session.participants.add(*group_users)
+
+                # Invitations are expanded and sent by a worker after commit
+                record_email_event(
+                    EmailEvent.INVITATION,
+                    session,
+                    current_site=get_current_site(request).domain,
+                )
 
             return redirect("session_list")
     else:
@@ -103,17 +114,18 @@ def create_session(request):
 
 
 @login_required
-def session_detail(request, session_id):
-    session = get_object_or_404(MealSession, id=session_id)
-
-    orders = session.orders.select_related("user").all()
-
-    orders_by_user = defaultdict(list)
-    for order in orders:
-        orders_by_user[order.user.id].append(order)
+async def session_detail(request, session_id):
+    user = await request.auser()
+    session = await aget_object_or_404(
+        MealSession.objects.select_related("restaurant"), id=session_id
+    )
 
-    participants_data = process_participants(
-        session, orders_by_user=orders_by_user, include_creator_info=True
+    participants, orders = await run_queries(
+        lambda: list(session.participants.all()),
+        lambda: list(get_session_orders(session)),
+    )
+    participants_data = build_participants_data(
+        session, participants, orders, include_creator_info=True
     )
 
     participants_data.sort(key=lambda x: not x["is_creator"])
@@ -121,9 +133,9 @@ def session_detail(request, session_id):
     context = {
         "session": session,
         "participants_data": participants_data,
-        "is_creator": request.user == session.creator,
+        "is_creator": user.id == session.creator_id,
     }
-    return render(request, "sessions/session_detail.html", context)
+    return await arender(request, "sessions/session_detail.html", context)
 
 
 @login_required
@@ -147,13 +159,22 @@ def session_edit(request, session_id):
 
             changes = get_session_changes(original_session, updated_session)
 
-            updated_session.save()
-            form.save_m2m()
-            session.participants.add(request.user)
-
-            if changes:
-                current_site = get_current_site(request)
-                send_session_update_email(current_site, changes, session)
+            with transaction.atomic():
+                # Only the edited columns, the counters are maintained with F()
+                updated_session.save(
+                    update_fields=["name", "restaurant", "order_deadline", "delivery_time"]
+                )
+                form.save_m2m()
+                touch_session(session.id)
+                session.participants.add(request.user)
+
+                if changes:
+                    record_email_event(
+                        EmailEvent.SESSION_UPDATE,
+                        session,
+                        current_site=get_current_site(request).domain,
+                        changes=changes,
+                    )
 
             return redirect("session_detail", session_id=session.id)
     else:
@@ -190,40 +211,47 @@ def create_order(request, session_id, user_id=None):
 
     if request.method == "POST":
         order_form = OrderForm(request.POST, instance=order)
-        formset = OrderItemFormSet(request.POST, instance=order)
-
-        for form in formset.forms:
-            form.fields['menu_item'].queryset = MenuItem.objects.filter(
-                restaurant=session.restaurant
-            )
+        formset = OrderItemFormSet(
+            request.POST, instance=order, menu=get_cached_menu(session.restaurant_id)
+        )
 
         if order_form.is_valid() and formset.is_valid():
             order = order_form.save(commit=False)
-            order.save()
-            formset.instance = order
-            formset.save()
-
-            order.total_price = sum(
-                item.menu_item.price * item.quantity
-                for item in order.orderitem_set.all()
-            )
-            order.save()
-
-            if request.user != user and request.user == session.creator:
-                current_site = get_current_site(request).domain
-                items_list = list(order.orderitem_set.all())
-                send_order_update_email(current_site, items_list, order)
+            try:
+                with transaction.atomic():
+                    order.save()
+                    formset.instance = order
+                    formset.save()
+
+                    update_order_total(order)
+                    publish_order_event(ORDER_CREATED, order, user)
+
+                    if request.user != user and request.user == session.creator:
+                        record_email_event(
+                            EmailEvent.ORDER_UPDATE,
+                            session,
+                            current_site=get_current_site(request).domain,
+                            changes=[
+                                str(item)
+                                for item in order.orderitem_set.select_related(
+                                    "menu_item", "order"
+                                )
+                            ],
+                            order_id=order.id,
+                            user_id=user.id,
+                        )
+            except IntegrityError:
+                # A concurrent request created the order first
+                messages.error(request, "Order already exists. You can edit it.")
+                return redirect("edit_order", session_id=session.id, user_id=user.id)
 
             messages.success(request, "Order has been created.")
             return redirect("session_detail", session_id=session.id)
     else:
         order_form = OrderForm(instance=order)
-        formset = OrderItemFormSet(instance=order)
-
-        for form in formset.forms:
-            form.fields['menu_item'].queryset = MenuItem.objects.filter(
-                restaurant=session.restaurant
-            )
+        formset = OrderItemFormSet(
+            instance=order, menu=get_cached_menu(session.restaurant_id)
+        )
 
     return render(
         request,
@@ -256,58 +284,76 @@ def edit_order(request, session_id, user_id):
     order = get_object_or_404(Order, session=session, user=user)
 
     if "cancel_order" in request.POST:
-        if request.user != user and request.user == session.creator:
-            current_site = get_current_site(request).domain
-            send_order_update_email(current_site, ["Order deleted"], order)
-        order.delete()
+        with transaction.atomic():
+            if request.user != user and request.user == session.creator:
+                record_email_event(
+                    EmailEvent.ORDER_UPDATE,
+                    session,
+                    current_site=get_current_site(request).domain,
+                    changes=["Order deleted"],
+                    order_id=order.id,
+                    user_id=user.id,
+                )
+            publish_order_event(ORDER_CANCELED, order, user)
+            order.delete()
         messages.success(request, "Order has been canceled.")
         return redirect("session_detail", session_id=session.id)
 
     original_order = Order.objects.get(pk=order.pk)
-    original_items = list(order.orderitem_set.all())
+    original_items = list(order.orderitem_set.select_related("menu_item"))
 
     if request.method == "POST":
         order_form = OrderForm(request.POST, instance=order)
-        formset = OrderItemFormSet(request.POST, instance=order)
-        for form in formset.forms:
-            form.fields['menu_item'].queryset = MenuItem.objects.filter(
-                restaurant=session.restaurant
-            )
-
+        formset = OrderItemFormSet(
+            request.POST, instance=order, menu=get_cached_menu(session.restaurant_id)
+        )
         if order_form.is_valid() and formset.is_valid():
             updated_order = order_form.save(commit=False)
 
-            formset.save()
-
-            deleted_items = formset.deleted_objects
-            updated_items = list(updated_order.orderitem_set.all())
-            updated_order.total_price = sum(
-                item.menu_item.price * item.quantity for item in updated_items
-            )
-            updated_order.save()
-
-            changes = get_order_changes(
-                original_order,
-                updated_order,
-                original_items,
-                updated_items,
-                deleted_items,
-            )
-
-            if changes and request.user != user and request.user == session.creator:
-                current_site = get_current_site(request).domain
-                send_order_update_email(current_site, changes, updated_order)
+            with transaction.atomic():
+                # Lock the order before its stored values are read by the save
+                # signals and update_order_total, so concurrent edits by the
+                # participant and the creator apply their deltas one by one
+                updated_order.total_price = (
+                    Order.objects.select_for_update()
+                    .values_list("total_price", flat=True)
+                    .get(pk=updated_order.pk)
+                )
+                updated_order.save(update_fields=["payment_method"])
+                formset.save()
+
+                deleted_items = formset.deleted_objects
+                updated_items = list(
+                    updated_order.orderitem_set.select_related("menu_item")
+                )
+                update_order_total(updated_order)
+                publish_order_event(ORDER_UPDATED, updated_order, user)
+
+                changes = get_order_changes(
+                    original_order,
+                    updated_order,
+                    original_items,
+                    updated_items,
+                    deleted_items,
+                )
+
+                if changes and request.user != user and request.user == session.creator:
+                    record_email_event(
+                        EmailEvent.ORDER_UPDATE,
+                        session,
+                        current_site=get_current_site(request).domain,
+                        changes=changes,
+                        order_id=updated_order.id,
+                        user_id=user.id,
+                    )
 
             messages.success(request, "Order has been saved.")
             return redirect("session_detail", session_id=session.id)
     else:
         order_form = OrderForm(instance=order)
-        formset = OrderItemFormSet(instance=order)
-        for form in formset.forms:
-            form.fields['menu_item'].queryset = MenuItem.objects.filter(
-                restaurant=session.restaurant
-            )
-
+        formset = OrderItemFormSet(
+            instance=order, menu=get_cached_menu(session.restaurant_id)
+        )
     return render(
         request,
         "sessions/edit_order.html",
@@ -322,41 +368,100 @@ def edit_order(request, session_id, user_id):
 
 
 @login_required
-def credit_balance_view(request):
-    current_user = request.user
-    orders_as_debtor = get_orders_as_debtor(current_user)
-    orders_as_creditor = get_orders_as_creditor(current_user)
-    balances = calculate_balances(orders_as_debtor, orders_as_creditor)
-    total_balance = sum(balances.values())
-    balances_list = format_balances_for_view(balances)
+async def credit_balance_view(request):
+    current_user = await request.auser()
+
+    try:
+        min_amount = Decimal(request.GET.get("min") or 0)
+    except InvalidOperation:
+        min_amount = Decimal(0)
+    if not min_amount.is_finite():
+        min_amount = Decimal(0)
+    ordering = request.GET.get("sort", "amount")
+
+    balances = get_credit_balances(current_user, min_amount, ordering)
+    page, total_balance = await run_queries(
+        lambda: load_page(balances, BALANCES_PER_PAGE, request.GET.get("page")),
+        lambda: CreditBalance.objects.filter(user=current_user).aggregate(
+            total=Sum("balance")
+        )["total"]
+        or 0,
+    )
+
+    balances_list = [
+        {"user": entry.counterparty, "balance": entry.balance} for entry in page
+    ]
     context = {
         "balances": balances_list,
+        "page": page,
         "total_balance": total_balance,
+        "min_amount": min_amount,
+        "ordering": ordering,
     }
-    return render(request, "sessions/credit_balance.html", context)
+    return await arender(request, "sessions/credit_balance.html", context)
 
 
 @login_required
-def session_summary(request, session_id):
-    session = get_object_or_404(MealSession, id=session_id)
+async def session_summary(request, session_id):
+    user = await request.auser()
+    session = await aget_object_or_404(
+        MealSession.objects.select_related("restaurant"), id=session_id
+    )
 
-    if request.user != session.creator:
-        return render(
+    if user.id != session.creator_id:
+        return await arender(
             request,
             "general/no_permission.html",
             {"message": "You do not have permission to view this summary."},
         )
 
-    participant_orders = process_participants(session)
-
-    aggregated_items = aggregate_order_items(session)
-
-    total_session_spent = sum(value["total_price"] for value in aggregated_items)
+    participants, orders, aggregated_items = await run_queries(
+        lambda: list(session.participants.all()),
+        lambda: list(get_session_orders(session)),
+        lambda: aggregate_order_items(session),
+    )
+    participant_orders = build_participants_data(
+        session, participants, orders, include_items=True
+    )
 
     context = {
         "session": session,
         "participant_orders": participant_orders,
         "aggregated_items": aggregated_items,
-        "total_session_spent": total_session_spent,
+        "total_session_spent": session.total_spent,
     }
-    return render(request, "sessions/session_summary.html", context)
+    return await arender(request, "sessions/session_summary.html", context)
+
+
+def get_export_format(request) -> str:
+    file_format = request.GET.get("format", "csv")
+    if file_format not in EXPORT_FORMATS:
+        raise Http404("Unknown export format.")
+    return file_format
+
+
+@login_required
+async def export_session_summary(request, session_id):
+    file_format = get_export_format(request)
+    user = await request.auser()
+    session = await aget_object_or_404(MealSession, id=session_id)
+
+    if user.id != session.creator_id:
+        return await arender(
+            request,
+            "general/no_permission.html",
+            {"message": "You do not have permission to export this summary."},
+        )
+
+    return export_response(
+        session_summary_sheets(session), file_format, f"session-{session.id}-summary"
+    )
+
+
+@login_required
+async def export_order_history(request):
+    file_format = get_export_format(request)
+    user = await request.auser()
+    return export_response(
+        order_history_sheets(user), file_format, f"order-history-{user.username}"
+    )